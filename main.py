@@ -1,6 +1,13 @@
-from src.preprocess import PaperRetriever
+import sys
+from src.pipeline import Pipeline
 
 
 if __name__ == "__main__":
-    paper_retriever = PaperRetriever()
-    paper_retriever.run(output_file="data/openalex_research_papers.json")
+    # Pass stage names to run only them and the stages they depend on, --force to
+    # rerun the named stages even if their inputs are unchanged (build_graph, which
+    # deletes the graph, only runs as `python main.py build_graph --force`), and
+    # --dry-run to only print which stages would run
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    force = args if "--force" in sys.argv else ()
+    status = Pipeline().run(args or None, force=force, dry_run="--dry-run" in sys.argv)
+    sys.exit(1 if "failed" in status.values() else 0)
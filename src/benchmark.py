@@ -0,0 +1,382 @@
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import resource
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Pipe, Process, get_context
+from src.synthetic import SyntheticOpenAlex, BLOCK_SIZE
+
+
+"""
+End-to-end scale benchmark of the pipeline on synthetic OpenAlex data:
+
+1. 🎲 Works come from the SyntheticOpenAlex generator at the requested scale (10k-10M)
+2. 🌐 Harvesting runs PaperRetriever against the local stand-in of openalex_stub.py
+3. ⏱️ Every stage runs in a fresh process, reporting items/s and its peak memory
+4. 📊 The report is saved to output/benchmarks/ and compared with the last run at the same scale
+
+Stages are capped by STAGE_LIMITS, since e.g. encoding 10M abstracts on a CPU takes days.
+The graph stage writes synthetic papers to BENCH_URI, so it only runs when named
+explicitly and should point to a scratch Neo4j instance.
+"""
+
+# ---------- CONFIG ---------- #
+REPORT_DIR = "output/benchmarks"
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+STAGES = ["harvest", "format", "embedding", "knn", "clustering", "gnn"]
+STAGE_LIMITS = {  # maximum number of works per stage, None for the full scale
+    "harvest": 1_000,
+    "format": None,
+    "graph": 20_000,
+    "embedding": 20_000,
+    "knn": 200_000,
+    "clustering": 1_000_000,
+    "gnn": 1_000_000,
+}
+BENCH_URI = "bolt://localhost:7687"
+BENCH_AUTH = ("neo4j", "trendgraph")
+MODEL_NAME = "all-MiniLM-L6-v2"
+KMEANS_K = 20
+GNN_EPOCHS = 5
+# ---------------------------- #
+
+
+def _rss_mb(field):
+    """VmHWM (peak) or VmRSS (current) of this process from /proc, in MB."""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is reported in kilobytes on Linux, and survives exec, so it can
+    # include the peak of the parent process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _start():
+    """
+    Starts the measured part of a stage, once its input is generated: resets the peak
+    memory to the current one (Linux only) and returns the start time.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return time.perf_counter()
+
+
+def _serve_process(num_works, listed, seed, conn):
+    from src.openalex_stub import serve
+
+    _, url = serve(num_works, listed=listed, seed=seed)
+    conn.send(url)
+    conn.recv()  # Serve until the benchmark is done
+
+
+def bench_harvest(corpus, n):
+    """PaperRetriever crawling `n` listed works (and their related works) over HTTP."""
+    from src.preprocess import PaperRetriever
+
+    # The stand-in runs in its own process, so it does not compete for this one's GIL
+    parent, child = Pipe()
+    server = Process(
+        target=_serve_process, args=(corpus.num_works, n, corpus.seed, child)
+    )
+    server.start()
+    try:
+        retriever = PaperRetriever(openalex_url=parent.recv())
+        start = _start()
+        retriever.fetch_papers()
+        seconds = time.perf_counter() - start
+    finally:
+        parent.send("stop")
+        server.join()
+    return {
+        "items": n,
+        "seconds": seconds,
+        "requests": retriever.REQUEST_COUNT,
+        "requests_per_s": retriever.REQUEST_COUNT / seconds,
+        "works_collected": len(retriever.data["works"]),
+    }
+
+
+def bench_format(corpus, n):
+    """invert_abstract_index and format_paper over `n` works (generation is not timed)."""
+    from src.openalex import format_paper, invert_abstract_index
+
+    # Works are generated block by block, so only the timed parts are summed
+    _start()
+    invert_seconds = format_seconds = 0.0
+    for start in range(0, n, BLOCK_SIZE):
+        works = list(corpus.works(start, min(start + BLOCK_SIZE, n)))
+        t = time.perf_counter()
+        for work in works:
+            invert_abstract_index(work["abstract_inverted_index"])
+        invert_seconds += time.perf_counter() - t
+        t = time.perf_counter()
+        for work in works:
+            format_paper(work)
+        format_seconds += time.perf_counter() - t
+    return {
+        "items": n,
+        "seconds": format_seconds,
+        "invert_abstract_index_per_s": n / invert_seconds,
+    }
+
+
+def synthetic_graph_data(corpus, n):
+    """The PaperRetriever output for the first `n` works, built without HTTP."""
+    from src.openalex import format_paper
+
+    data = {
+        "works": [],
+        "authors": [],
+        "citations": [],
+        "related_work": [],
+        "writes_work": [],
+    }
+    authors_seen = set()
+    for work in corpus.works(0, n):
+        data["works"].append(format_paper(work))
+        for authorship in work["authorships"]:
+            author = authorship["author"]
+            if author["id"] not in authors_seen:
+                authors_seen.add(author["id"])
+                data["authors"].append(
+                    {"id": author["id"], "name": author["display_name"]}
+                )
+            data["writes_work"].append(
+                {"author_id": author["id"], "paper_id": work["id"]}
+            )
+        for related in work["related_works"]:
+            if int(related.rsplit("W", 1)[1]) < n:
+                data["related_work"].append({"from": work["id"], "to": related})
+    return data
+
+
+def bench_graph(corpus, n):
+    """build_graph.create_graphdb loading `n` works into BENCH_URI."""
+    from neo4j import GraphDatabase
+    from src.build_graph import create_graphdb
+
+    data = synthetic_graph_data(corpus, n)
+    with GraphDatabase.driver(BENCH_URI, auth=BENCH_AUTH).session() as session:
+        start = _start()
+        create_graphdb(session, data)
+        seconds = time.perf_counter() - start
+    return {
+        "items": n,
+        "seconds": seconds,
+        "relationships": len(data["writes_work"]) + len(data["related_work"]),
+    }
+
+
+def bench_embedding(corpus, n):
+    """encode_texts over the abstracts of `n` works."""
+    from src.embedding import encode_texts, load_model
+    from src.openalex import invert_abstract_index
+
+    texts = [
+        invert_abstract_index(work["abstract_inverted_index"])
+        for work in corpus.works(0, n)
+    ]
+    model = load_model(MODEL_NAME)
+    start = _start()
+    encode_texts(texts, model=model)
+    return {"items": n, "seconds": time.perf_counter() - start}
+
+
+def bench_knn(corpus, n):
+    """Exact top-k similar papers of `n` topic-clustered embeddings."""
+    from src.knn import TOP_K, exact_top_k
+
+    embeddings = corpus.embeddings(n)
+    start = _start()
+    exact_top_k(embeddings, k=TOP_K)
+    return {"items": n, "seconds": time.perf_counter() - start}
+
+
+def bench_clustering(corpus, n):
+    """Mini-batch KMeans (k=KMEANS_K) of `n` embeddings."""
+    from src.kmeans import minibatch_kmeans
+
+    embeddings = corpus.embeddings(n)
+    start = _start()
+    minibatch_kmeans(embeddings, KMEANS_K)
+    return {"items": n, "seconds": time.perf_counter() - start}
+
+
+def bench_gnn(corpus, n):
+    """Full-batch GCN epochs on the related-work graph of `n` works."""
+    import torch
+    from torch_geometric.data import Data
+    from src.gnn import train_model_fast
+
+    x, y, edge_index = corpus.graph(n)
+    data = Data(x=torch.from_numpy(x), edge_index=torch.from_numpy(edge_index))
+    train_mask = torch.rand(n) < 0.8
+    start = _start()
+    train_model_fast(
+        data, train_mask, ~train_mask, torch.from_numpy(y), epochs=GNN_EPOCHS
+    )
+    seconds = time.perf_counter() - start
+    return {
+        "items": n * GNN_EPOCHS,  # node-epochs
+        "seconds": seconds,
+        "seconds_per_epoch": seconds / GNN_EPOCHS,
+        "edges": edge_index.shape[1],
+    }
+
+
+BENCHMARKS = {
+    "harvest": bench_harvest,
+    "format": bench_format,
+    "graph": bench_graph,
+    "embedding": bench_embedding,
+    "knn": bench_knn,
+    "clustering": bench_clustering,
+    "gnn": bench_gnn,
+}
+
+
+def _stage_worker(stage, scale, n, seed):
+    corpus = SyntheticOpenAlex(scale, seed=seed)
+    try:
+        result = BENCHMARKS[stage](corpus, n)
+    except Exception as e:  # e.g. an optional dependency or Neo4j missing
+        return {"error": f"{type(e).__name__}: {e}"}
+    result["items_per_s"] = result["items"] / result["seconds"]
+    # Peak since _start, so it includes the stage's input but not its generation
+    result["peak_rss_mb"] = _rss_mb("VmHWM")
+    return result
+
+
+def environment():
+    import torch
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(scale, stages=STAGES, seed=0):
+    """
+    Runs each of `stages` in its own process at `scale` works (capped by STAGE_LIMITS)
+    and returns the report.
+    """
+    report = {
+        "scale": scale,
+        "seed": seed,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "stages": {},
+    }
+    for stage in stages:
+        n = min(scale, STAGE_LIMITS.get(stage) or scale)
+        print(f"▶️  {stage}: {n} works")
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn")
+        ) as pool:
+            result = pool.submit(_stage_worker, stage, scale, n, seed).result()
+        report["stages"][stage] = {"works": n, **result}
+        if "error" in result:
+            print(f"⚠️  {stage}: skipped ({result['error']})")
+        else:
+            print(
+                f"✅ {stage}: {result['items_per_s']:.1f} items/s, "
+                f"peak {result['peak_rss_mb']:.0f} MB"
+            )
+    return report
+
+
+def save_report(report, report_dir=REPORT_DIR):
+    os.makedirs(report_dir, exist_ok=True)
+    stamp = report["started_at"].replace(":", "").replace("-", "")
+    path = os.path.join(report_dir, f"benchmark_{report['scale']}_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"Saved benchmark report to {path}")
+    return path
+
+
+def previous_report(scale, exclude=None, report_dir=REPORT_DIR):
+    """The most recent saved report at `scale`, other than `exclude`."""
+    paths = sorted(glob.glob(os.path.join(report_dir, f"benchmark_{scale}_*.json")))
+    paths = [p for p in paths if p != exclude]
+    if not paths:
+        return None
+    with open(paths[-1], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(report, baseline):
+    """Prints items/s and peak memory of each stage next to the baseline run."""
+    print(
+        f"\n{'Stage':<11} {'works':>9} {'items/s':>12} {'vs base':>8} "
+        f"{'peak MB':>8} {'vs base':>8}"
+    )
+    for stage, result in report["stages"].items():
+        if "error" in result:
+            print(f"{stage:<11} {result['works']:>9} {'skipped':>12}")
+            continue
+        base = (baseline or {}).get("stages", {}).get(stage, {})
+        speed = memory = "-"
+        if "items_per_s" in base and base.get("works") == result["works"]:
+            speed = f"{result['items_per_s'] / base['items_per_s'] - 1:+.0%}"
+            memory = f"{result['peak_rss_mb'] / base['peak_rss_mb'] - 1:+.0%}"
+        print(
+            f"{stage:<11} {result['works']:>9} {result['items_per_s']:>12.1f} "
+            f"{speed:>8} {result['peak_rss_mb']:>8.0f} {memory:>8}"
+        )
+    if baseline:
+        print(
+            f"\nBaseline: {baseline['started_at']} "
+            f"(commit {baseline['environment'].get('commit')})"
+        )
+
+
+def parse_scale(value):
+    return SCALES.get(value.lower()) or int(value)
+
+
+def main(scale="10k", stages=STAGES, baseline_path=None):
+    scale = parse_scale(scale)
+    report = run_benchmarks(scale, stages)
+    path = save_report(report)
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    else:
+        baseline = previous_report(scale, exclude=path)
+    compare(report, baseline)
+
+
+if __name__ == "__main__":
+    # Pass the scale (10k, 100k, 1m, 10m or a number of works), optionally followed by
+    # the stages to run, and --compare <report.json> to compare against a given run
+    args = sys.argv[1:]
+    baseline_path = None
+    if "--compare" in args:
+        i = args.index("--compare")
+        baseline_path = args[i + 1]
+        args = args[:i] + args[i + 2 :]
+    main(args[0] if args else "10k", args[1:] or STAGES, baseline_path)
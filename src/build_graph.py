@@ -1,12 +1,29 @@
 import json
 from tqdm import tqdm
 from neo4j import GraphDatabase, Session
+from src import metrics
+
+
+# Every writer looks nodes up by these keys, one row at a time in the UNWIND batches,
+# so without an index each row would scan the whole label
+CONSTRAINTS = {
+    "paper_id": "(p:Paper) REQUIRE p.paper_id IS UNIQUE",
+    "author_id": "(a:Author) REQUIRE a.id IS UNIQUE",
+    "topic_name": "(t:Topic) REQUIRE t.name IS UNIQUE",
+}
+
+
+def create_constraints(session: Session):
+    """Creates the uniqueness constraints (and their backing indexes) if missing."""
+    for name, constraint in CONSTRAINTS.items():
+        session.run(f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR {constraint}")
 
 
 def create_graphdb(tx: Session, data):
     # Create authors
     for author in tqdm(data["authors"]):
-        tx.execute_write(
+        metrics.execute_write(
+            tx,
             lambda tx, elem: tx.run(
                 """
                     MERGE (a:Author {id: $id})
@@ -15,11 +32,13 @@ def create_graphdb(tx: Session, data):
                 elem,
             ),
             author,
+            query="author",
         )
 
     # Create works
     for work in tqdm(data["works"]):
-        tx.execute_write(
+        metrics.execute_write(
+            tx,
             lambda tx, elem: tx.run(
                 """
                     MERGE (p:Paper {paper_id: $paper_id})
@@ -28,12 +47,14 @@ def create_graphdb(tx: Session, data):
                 elem,
             ),
             work,
+            query="work",
         )
 
         for topic in work["topics"]:
             topic_data = {"paper_id": work["paper_id"], "topic_name": topic}
 
-            tx.execute_write(
+            metrics.execute_write(
+                tx,
                 lambda tx, elem: tx.run(
                     """
                         MERGE (t:Topic {name: $topic_name})
@@ -44,11 +65,13 @@ def create_graphdb(tx: Session, data):
                     topic_data,
                 ),
                 topic_data,
+                query="topic",
             )
 
     # Create WROTE relationships (Author → Paper)
     for elem in tqdm(data["writes_work"]):
-        tx.execute_write(
+        metrics.execute_write(
+            tx,
             lambda tx, elem: tx.run(
                 """
                 MATCH (a:Author {id: $author_id})
@@ -58,11 +81,13 @@ def create_graphdb(tx: Session, data):
                 elem,
             ),
             elem,
+            query="wrote",
         )
 
     # Create CITED relationships (Paper → Paper)
     for elem in tqdm(data["citations"]):
-        tx.execute_write(
+        metrics.execute_write(
+            tx,
             lambda tx, elem: tx.run(
                 """
                 MATCH (src:Paper {paper_id: $from})
@@ -72,11 +97,13 @@ def create_graphdb(tx: Session, data):
                 elem,
             ),
             elem,
+            query="cites",
         )
 
     # Create RELATED relationships (Paper → Paper)
     for elem in tqdm(data["related_work"]):
-        tx.execute_write(
+        metrics.execute_write(
+            tx,
             lambda tx, elem: tx.run(
                 """
                 MATCH (src:Paper {paper_id: $from})
@@ -86,6 +113,7 @@ def create_graphdb(tx: Session, data):
                 elem,
             ),
             elem,
+            query="related",
         )
 
 
@@ -99,6 +127,10 @@ if __name__ == "__main__":
 
     # Build the knowledge graph
     with GraphDatabase.driver(URI, auth=AUTH).session() as session:
-        session.execute_write(lambda tx: tx.run("MATCH (n) DETACH DELETE n"))
-        create_graphdb(session, openalex_data)
+        metrics.execute_write(
+            session, lambda tx: tx.run("MATCH (n) DETACH DELETE n"), query="reset"
+        )
+        create_constraints(session)
+        with metrics.span("build_graph"):
+            create_graphdb(session, openalex_data)
         print("Graph database initialized.")
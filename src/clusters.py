@@ -1,14 +1,18 @@
+import sys
+from tqdm import tqdm
 from neo4j import GraphDatabase
 from graphdatascience import GraphDataScience
+import numpy as np
 import pandas as pd
-from collections import Counter
-from sklearn.metrics import normalized_mutual_info_score
+from src import metrics
+from src.projection import ProjectionManager
+from src.embedding_store import EmbeddingStore
+from src.kmeans import sweep
 
 # Neo4j connection
 URI = "bolt://localhost:7687"
 AUTH = ("neo4j", "trendgraph")
 driver = GraphDatabase.driver(URI, auth=AUTH)
-gds = GraphDataScience(driver)
 
 
 POPULAR_TOPICS = [
@@ -26,108 +30,197 @@ POPULAR_TOPICS = [
 
 POPULAR_TOPIC_SET = set(POPULAR_TOPICS)
 
+# Local KMeans sweep
+KS = [5, 8, 10, 12, 15, 20]
+RESTARTS = 3
+WRITE_BATCH_SIZE = 5000  # papers per write transaction
 
-def create_named_graph():
-    """
-    Project the graph into a named graph for GDS algorithms with all the Paper nodes (embedding property).
-    """
+# Topic distribution
+MIN_TOPIC_COUNT = 100  # topics with fewer papers in a cluster are left out
+TOP_TOPICS = 5  # most frequent topics listed per cluster
 
-    gds.graph.project.cypher(
-        "paper_graph",
-        """
-        MATCH (p:Paper)
-        WHERE p.embedding IS NOT NULL
-        RETURN id(p) AS id, labels(p) AS labels, p.embedding AS embedding
-        """,
-        """
-        MATCH (p1:Paper)-[r]->(p2:Paper)
-        WHERE p1.embedding IS NOT NULL AND p2.embedding IS NOT NULL
-        RETURN id(p1) AS source, id(p2) AS target, type(r) AS type
-        """,
-    )
-    paper_graph = gds.graph.get("paper_graph")
-    print(
-        f"projected graph: {paper_graph.node_count()} nodes, {paper_graph.relationship_count()} edges"
-    )
-    print("Named graph 'paper_graph' created successfully.")
 
-
-def run_gds_kmeans():
-    with driver.session() as session:
-        result = session.run(
+def run_gds_kmeans(graph_name):
+    with driver.session() as session, metrics.neo4j_query("gds_kmeans", mode="gds"):
+        session.run(
             """
-                CALL gds.kmeans.write('paper_graph', {
+                CALL gds.kmeans.write($graph_name, {
                     nodeLabels: ['Paper'],
                     nodeProperty: 'embedding',
                     writeProperty: 'cluster',
                     k: 10,
                     maxIterations: 20
                 })
-            """
-        )
+            """,
+            graph_name=graph_name,
+        ).consume()
 
 
-def fetch_clusters_and_topics():
-    with driver.session() as session:
+def fetch_topic_labels(paper_ids):
+    """
+    Reference labels for the NMI: the index in POPULAR_TOPICS of the most popular
+    topic of each paper, or -1 for papers with none of them.
+    """
+    with driver.session() as session, metrics.neo4j_query("topic_labels"):
         result = session.run(
             """
             MATCH (p:Paper)-[:HAS_TOPIC]->(t:Topic)
-            RETURN p.paper_id AS id, p.cluster AS cluster, t.name AS topic
-        """
+            WHERE t.name IN $topics
+            RETURN p.paper_id AS id, collect(t.name) AS topics
+        """,
+            topics=POPULAR_TOPICS,
         )
-        return [
-            {"id": r["id"], "cluster": r["cluster"], "topic": r["topic"]}
+        topic_of = {
+            r["id"]: min(
+                POPULAR_TOPICS.index(t) for t in r["topics"] if t in POPULAR_TOPIC_SET
+            )
             for r in result
-        ]
-
-
-def compute_topic_distribution(data, output_csv_path):
-    df = pd.DataFrame(data)
-
-    # Compute topic counts per cluster
-    cluster_topic_counts = (
-        df.groupby(["cluster", "topic"])
-        .size()
-        .reset_index(name="count")
-        .query("count > 100")
-        .sort_values(["cluster", "count"], ascending=[True, False])
+        }
+    return np.array(
+        [topic_of.get(paper_id, -1) for paper_id in paper_ids], dtype=np.int64
     )
 
-    # Export to CSV
-    cluster_topic_counts.to_csv(output_csv_path, index=False)
-    print(f"Exported topic distribution to {output_csv_path}")
 
-
-def delete_named_graph():
+def write_clusters(paper_ids, labels, batch_size=WRITE_BATCH_SIZE):
     with driver.session() as session:
-        session.run(
-            """
-            CALL gds.graph.drop('paper_graph')
-            YIELD graphName
-            RETURN graphName
-            """
+        for i in tqdm(range(0, len(paper_ids), batch_size), desc="Writing clusters"):
+            rows = [
+                {"id": paper_id, "cluster": int(label)}
+                for paper_id, label in zip(
+                    paper_ids[i : i + batch_size], labels[i : i + batch_size]
+                )
+            ]
+            metrics.execute_write(
+                session,
+                lambda tx, rows: tx.run(
+                    """
+                    UNWIND $rows AS row
+                    MATCH (p:Paper {paper_id: row.id})
+                    SET p.cluster = row.cluster
+                    """,
+                    rows=rows,
+                ),
+                rows,
+                query="clusters",
+            )
+
+
+def run_local_kmeans(output_csv_path, ks=KS, restarts=RESTARTS, processes=None):
+    """
+    Sweeps k with the in-process mini-batch KMeans, exports the quality of every k
+    and writes the assignment with the best silhouette back as `cluster`.
+    """
+    store = EmbeddingStore()
+    if not store.exists():
+        raise FileNotFoundError(
+            f"No embedding store at {store.path}, run `python -m src.similarities` first"
         )
-        print("Named graph 'paper_graph' deleted successfully.")
-
+    topic_labels = fetch_topic_labels(store.ids)
+    results = sweep(
+        store, ks, restarts=restarts, processes=processes, topic_labels=topic_labels
+    )
 
-def main():
-    delete_named_graph()
-    print("Creating named graph...")
-    create_named_graph()
+    pd.DataFrame(
+        [{key: value for key, value in r.items() if key != "labels"} for r in results]
+    ).to_csv(output_csv_path, index=False)
+    print(f"Exported k sweep to {output_csv_path}")
 
-    print("Running KMeans...")
-    run_gds_kmeans()
+    best = max(
+        results, key=lambda r: r["silhouette"] if r["silhouette"] is not None else -1
+    )
+    print(f"Best k={best['k']} (silhouette {best['silhouette']}, NMI {best['nmi']})")
+    write_clusters(store.ids, best["labels"])
 
-    print("Fetching paper cluster/topic assignments...")
-    data = fetch_clusters_and_topics()
 
-    print("Computing and exporting topic distribution...")
-    compute_topic_distribution(data, "output/topic_distribution_per_cluster.csv")
+def fetch_topic_distribution(min_count=MIN_TOPIC_COUNT, top_k=TOP_TOPICS):
+    """
+    Aggregates the topic counts of every cluster in Neo4j, so only one row per
+    cluster crosses the wire. Each row holds the cluster size, the topics with more
+    than `min_count` papers and the `top_k` most frequent topics.
+    """
+    with driver.session() as session, metrics.neo4j_query("topic_distribution"):
+        result = session.run(
+            """
+            MATCH (p:Paper)
+            WHERE p.cluster IS NOT NULL
+            WITH p.cluster AS cluster, collect(p) AS papers
+            UNWIND papers AS p
+            MATCH (p)-[:HAS_TOPIC]->(t:Topic)
+            WITH cluster, size(papers) AS papers, t.name AS topic, count(*) AS count
+            ORDER BY cluster, count DESC
+            WITH cluster, papers, collect({topic: topic, count: count}) AS topics
+            RETURN cluster, papers,
+                   [x IN topics WHERE x.count > $min_count] AS distribution,
+                   topics[0..$top_k] AS top_topics
+            ORDER BY cluster
+        """,
+            min_count=min_count,
+            top_k=top_k,
+        )
+        return [r.data() for r in result]
+
+
+def compute_topic_distribution(clusters, output_csv_path, summary_csv_path):
+    # Topic counts per cluster above the threshold
+    cluster_topic_counts = pd.DataFrame(
+        [
+            {"cluster": c["cluster"], "topic": x["topic"], "count": x["count"]}
+            for c in clusters
+            for x in c["distribution"]
+        ],
+        columns=["cluster", "topic", "count"],
+    )
+    cluster_topic_counts.to_csv(output_csv_path, index=False)
+    print(f"Exported topic distribution to {output_csv_path}")
 
-    print("Deleting named graph...")
-    delete_named_graph()
+    # Purity: share of the cluster's papers that have its most frequent topic
+    summary = pd.DataFrame(
+        [
+            {
+                "cluster": c["cluster"],
+                "papers": c["papers"],
+                "purity": (
+                    round(c["top_topics"][0]["count"] / c["papers"], 4)
+                    if c["top_topics"]
+                    else 0.0
+                ),
+                "top_topics": "; ".join(
+                    f"{x['topic']} ({x['count']})" for x in c["top_topics"]
+                ),
+            }
+            for c in clusters
+        ],
+        columns=["cluster", "papers", "purity", "top_topics"],
+    )
+    summary.to_csv(summary_csv_path, index=False)
+    print(f"Exported cluster summary to {summary_csv_path}")
+
+
+def main(use_gds=False):
+    if use_gds:
+        print("Getting named graph...")
+        # Only built here: the client checks the GDS version on construction, which
+        # fails on servers without the plugin
+        paper_graph = ProjectionManager(GraphDataScience(driver)).get()
+
+        print("Running KMeans...")
+        run_gds_kmeans(paper_graph.name())
+    else:
+        print("Running KMeans sweep...")
+        run_local_kmeans("output/kmeans_sweep.csv")
+
+    print("Aggregating topics per cluster...")
+    clusters = fetch_topic_distribution()
+
+    print("Exporting topic distribution...")
+    compute_topic_distribution(
+        clusters,
+        "output/topic_distribution_per_cluster.csv",
+        "output/cluster_summary.csv",
+    )
     print("Done!")
 
 
 if __name__ == "__main__":
-    main()
+    # Pass --gds to cluster with gds.kmeans (k=10) instead of the local sweep
+    main(use_gds="--gds" in sys.argv)
@@ -0,0 +1,251 @@
+import os
+import csv
+import time
+import numpy as np
+import torch
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from sentence_transformers import SentenceTransformer
+from src import metrics
+
+
+"""
+High-throughput CPU encoding of abstracts:
+
+1. 📏 Sort texts by token length and cut them into batches, so little time is spent on padding
+2. 🧵 Spread the batches over a pool of worker processes, each with its own thread budget
+3. ⚡ Optionally run an int8-quantized torch model or an ONNX Runtime backend
+4. 📊 Benchmark abstracts/s of each configuration and check it against the reference model
+"""
+
+# ---------- CONFIG ---------- #
+ENCODE_BATCH_SIZE = 64
+TASK_BATCHES = 16  # batches sent to a worker process at once
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"  # shipped with all-MiniLM-L6-v2
+MIN_COSINE_TO_REFERENCE = 0.98  # below this a backend is flagged as inaccurate
+BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+# ---------------------------- #
+
+
+def load_model(model_name, backend="torch"):
+    """
+    Loads the sentence-transformers model on CPU with one of BACKENDS.
+    """
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        model = SentenceTransformer(model_name, device="cpu")
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(
+            model_name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": ONNX_INT8_FILE},
+        )
+    raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+
+def length_buckets(texts, tokenizer, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Returns batches of positions into `texts`, cut from the texts sorted by token
+    length, so every batch holds texts of similar length.
+    """
+    lengths = np.fromiter(
+        (len(ids) for ids in tokenizer(texts, truncation=True)["input_ids"]),
+        dtype=np.int64,
+        count=len(texts),
+    )
+    order = np.argsort(lengths, kind="stable")
+    return [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _encode_batches(model, batches):
+    return [
+        model.encode(batch, batch_size=len(batch), normalize_embeddings=True)
+        for batch in batches
+    ]
+
+
+# Model loaded once in each worker process by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name, backend, threads):
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = load_model(model_name, backend)
+
+
+def _worker_encode(batches):
+    return _encode_batches(_worker_model, batches)
+
+
+class EncoderPool:
+    """
+    Worker processes that each load `model_name` with `backend` once and use
+    cpu_count / processes threads. Reusing one pool across encode_texts calls saves
+    the process startup and model load of every call.
+    """
+
+    def __init__(self, model_name, backend="torch", processes=2):
+        threads = max(1, (os.cpu_count() or 1) // processes)
+        self.executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, threads),
+        )
+
+    def encode(self, text_batches):
+        tasks = [
+            text_batches[i : i + TASK_BATCHES]
+            for i in range(0, len(text_batches), TASK_BATCHES)
+        ]
+        return [
+            emb for result in self.executor.map(_worker_encode, tasks) for emb in result
+        ]
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def encode_texts(
+    texts,
+    model=None,
+    model_name=None,
+    backend="torch",
+    processes=1,
+    batch_size=ENCODE_BATCH_SIZE,
+    pool=None,
+):
+    """
+    Encodes `texts` into normalized float32 embeddings, in the order of `texts`.
+
+    The texts are bucketed by token length. The batches are encoded by `pool` (an
+    EncoderPool) if given, else with processes > 1 by a pool started for this call;
+    otherwise `model` is used in-process.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    if model is None:
+        model = load_model(model_name, backend)
+
+    start = time.perf_counter()
+    batches = length_buckets(texts, model.tokenizer, batch_size)
+    text_batches = [[texts[i] for i in batch] for batch in batches]
+
+    if pool is not None:
+        encoded = pool.encode(text_batches)
+    elif processes > 1:
+        with EncoderPool(model_name, backend, processes) as pool:
+            encoded = pool.encode(text_batches)
+    else:
+        encoded = _encode_batches(model, text_batches)
+
+    embeddings = np.empty((len(texts), encoded[0].shape[1]), dtype=np.float32)
+    for batch, emb in zip(batches, encoded):
+        embeddings[batch] = emb
+
+    seconds = time.perf_counter() - start
+    metrics.inc("encoded_texts_total", len(texts), backend=backend)
+    metrics.observe("encode_seconds", seconds, backend=backend)
+    metrics.set_gauge(
+        "encode_texts_per_second", len(texts) / max(seconds, 1e-9), backend=backend
+    )
+    return embeddings
+
+
+def accuracy_check(embeddings, reference):
+    """
+    Row-wise cosine similarity between two sets of normalized embeddings of the same texts.
+    """
+    cosine = np.sum(embeddings * reference, axis=1)
+    return {"mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min())}
+
+
+def benchmark(texts, model_name, configs, output_csv_path=None):
+    """
+    Encodes `texts` with each (backend, processes) configuration, reporting abstracts/s
+    and the agreement with the plain torch model. The first configuration should be
+    ("torch", 1), which is used as the reference.
+    """
+    rows = []
+    reference = None
+    for backend, processes in configs:
+        model = load_model(model_name, backend) if processes == 1 else None
+        start = time.perf_counter()
+        embeddings = encode_texts(
+            texts,
+            model=model,
+            model_name=model_name,
+            backend=backend,
+            processes=processes,
+        )
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = embeddings
+        accuracy = accuracy_check(embeddings, reference)
+        row = {
+            "backend": backend,
+            "processes": processes,
+            "seconds": round(elapsed, 2),
+            "abstracts_per_s": round(len(texts) / elapsed, 1),
+            **{k: round(v, 4) for k, v in accuracy.items()},
+        }
+        rows.append(row)
+
+        flag = ""
+        if accuracy["min_cosine"] < MIN_COSINE_TO_REFERENCE:
+            flag = " ⚠️ below reference threshold"
+        print(
+            f"{backend:<11} x{processes}: {row['abstracts_per_s']:>8} abstracts/s, "
+            f"min cosine to reference {row['min_cosine']:.4f}{flag}"
+        )
+
+    if output_csv_path:
+        with open(output_csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Exported benchmark to {output_csv_path}")
+    return rows
+
+
+if __name__ == "__main__":
+    from neo4j import GraphDatabase
+
+    URI = "bolt://localhost:7687"
+    AUTH = ("neo4j", "trendgraph")
+    MODEL_NAME = "all-MiniLM-L6-v2"
+    SAMPLE_SIZE = 5000
+
+    with GraphDatabase.driver(URI, auth=AUTH) as driver:
+        with driver.session() as session:
+            result = session.run(
+                """
+                MATCH (p:Paper)
+                WHERE p.abstract IS NOT NULL
+                RETURN p.abstract AS abstract
+                LIMIT $limit
+            """,
+                limit=SAMPLE_SIZE,
+            )
+            sample = [r["abstract"] for r in result]
+
+    cpus = os.cpu_count() or 1
+    configs = [("torch", 1), ("torch-int8", 1), ("onnx", 1), ("onnx-int8", 1)]
+    if cpus >= 4:
+        configs += [("torch", cpus // 2), ("onnx-int8", cpus // 2)]
+    benchmark(sample, MODEL_NAME, configs, "output/embedding_benchmark.csv")
@@ -0,0 +1,262 @@
+import os
+import json
+import glob
+import uuid
+import shutil
+import numpy as np
+from src import metrics
+
+
+"""
+On-disk store of the abstract embeddings shared by similarities.py, clusters.py and gnn.py.
+
+Each embedding model gets its own directory under STORE_DIR holding:
+- vectors.npy: (n, d) float32/float16 matrix, memory-mapped on load
+- ids.json: the paper_id of each row
+- meta.json: model name, dimension, dtype, row count and a revision changed by every write
+
+STORE_DIR/current.json names the model similarities.py last embedded with. Readers
+that do not ask for a model open that one, so they follow a change of MODEL_NAME
+instead of reading the previous model's store.
+"""
+
+# ---------- CONFIG ---------- #
+STORE_DIR = "data/embeddings"
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"  # until a store is made current
+CURRENT_FILE = "current.json"
+COPY_CHUNK_ROWS = 100_000  # rows copied at once when rewriting the matrix
+FETCH_PAGE_SIZE = 20_000  # embeddings read from Neo4j per query when seeding a store
+# ---------------------------- #
+
+
+def fetch_embedding_pages(driver, model_name=None, page_size=FETCH_PAGE_SIZE):
+    """
+    Yields the paper ids and embeddings stored in Neo4j, optionally only those
+    computed by `model_name`, in pages of up to `page_size` papers ordered by
+    paper_id. Each page is an (ids, (n, d) float32 matrix) pair.
+    """
+    after_id = ""
+    while True:
+        with driver.session() as session, metrics.neo4j_query("embeddings_page"):
+            result = session.run(
+                """
+                MATCH (p:Paper)
+                WHERE p.paper_id > $after_id AND p.embedding IS NOT NULL
+                  AND ($model_name IS NULL OR p.embedding_model = $model_name)
+                RETURN p.paper_id AS id, p.embedding AS embedding
+                ORDER BY p.paper_id
+                LIMIT $limit
+            """,
+                after_id=after_id,
+                model_name=model_name,
+                limit=page_size,
+            )
+            ids, embeddings = [], []
+            for r in result:
+                ids.append(r["id"])
+                embeddings.append(r["embedding"])
+
+        if not ids:
+            return
+        yield ids, np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        after_id = ids[-1]
+
+
+def current_model_name(root=STORE_DIR):
+    """Model of the current store under `root`, DEFAULT_MODEL_NAME if none is set."""
+    path = os.path.join(root, CURRENT_FILE)
+    if not os.path.exists(path):
+        return DEFAULT_MODEL_NAME
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["model_name"]
+
+
+class EmbeddingStore:
+    """
+    Memory-mapped embedding matrix with a paper_id <-> row index, versioned by model name.
+    """
+
+    def __init__(self, model_name=None, root=STORE_DIR, dtype=None):
+        # dtype of staged chunks and rewritten matrices; None keeps the stored one
+        # (float32 for a new store)
+        self.model_name = model_name or current_model_name(root)
+        self.root = root
+        self.path = os.path.join(root, self.model_name.replace("/", "__"))
+        self.requested_dtype = dtype
+        self.dtype = np.dtype(dtype or "float32")
+        self.ids = []
+        self.row_of = {}
+        self.vectors = None
+        self.revision = None
+
+        if self.exists():
+            self.load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self):
+        return os.path.exists(self._file("meta.json"))
+
+    @property
+    def vectors_path(self):
+        """The .npy matrix, for processes that only need the vectors, not the ids."""
+        return self._file("vectors.npy")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def make_current(self):
+        """Makes this store the one opened by readers that do not name a model."""
+        path = os.path.join(self.root, CURRENT_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name}, f)
+        os.replace(path + ".tmp", path)
+
+    def load(self):
+        """Memory-maps the matrix; nothing is read from disk until rows are accessed."""
+        with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["model_name"] != self.model_name:
+            raise ValueError(
+                f"Embedding store at {self.path} was built with {meta['model_name']}, not {self.model_name}"
+            )
+
+        with open(self._file("ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.row_of = {paper_id: i for i, paper_id in enumerate(self.ids)}
+        self.vectors = np.load(self._file("vectors.npy"), mmap_mode="r")
+        if self.requested_dtype is None:
+            self.dtype = self.vectors.dtype
+        self.revision = meta.get("revision")
+        return self
+
+    def rows(self, paper_ids):
+        """Row index of each paper id, -1 for papers not in the store."""
+        return np.fromiter(
+            (self.row_of.get(paper_id, -1) for paper_id in paper_ids),
+            dtype=np.int64,
+            count=len(paper_ids),
+        )
+
+    def get(self, paper_ids):
+        """Embeddings of the given papers as a float32 array. All ids must be in the store."""
+        rows = self.rows(paper_ids)
+        if (rows < 0).any():
+            raise KeyError(
+                f"{int((rows < 0).sum())} papers are not in the embedding store"
+            )
+        return np.asarray(self.vectors[rows], dtype=np.float32)
+
+    def write(self, paper_ids, vectors):
+        """Replaces the whole store with the given embeddings."""
+        self._rewrite(list(paper_ids), [(np.asarray(vectors), None)])
+
+    def upsert(self, paper_ids, vectors):
+        """
+        Overwrites the rows of papers already in the store and appends the new ones.
+        """
+        self._upsert_chunks([(list(paper_ids), np.asarray(vectors))])
+
+    def stage(self, paper_ids, vectors):
+        """
+        Saves a chunk of embeddings under pending/ without touching the matrix, so a
+        stream of chunks costs one rewrite in merge_pending instead of one per chunk.
+        """
+        pending = self._file("pending")
+        os.makedirs(pending, exist_ok=True)
+        n_chunks = len(glob.glob(os.path.join(pending, "*.npy")))
+        name = os.path.join(pending, f"chunk_{n_chunks:06d}")
+        np.save(name + ".npy", np.asarray(vectors, dtype=self.dtype))
+        with open(name + ".json", "w", encoding="utf-8") as f:
+            json.dump(list(paper_ids), f)
+
+    def has_pending(self):
+        return bool(glob.glob(os.path.join(self._file("pending"), "*.npy")))
+
+    def pending_ids(self):
+        """Ids of every staged paper, in staging order."""
+        ids = []
+        for name in sorted(glob.glob(os.path.join(self._file("pending"), "*.json"))):
+            with open(name, "r", encoding="utf-8") as f:
+                ids += json.load(f)
+        return ids
+
+    def merge_pending(self):
+        """Upserts every staged chunk in order and removes them."""
+        chunks = []
+        for name in sorted(glob.glob(os.path.join(self._file("pending"), "*.npy"))):
+            with open(name[: -len(".npy")] + ".json", "r", encoding="utf-8") as f:
+                chunks.append((json.load(f), np.load(name, mmap_mode="r")))
+        if chunks:
+            self._upsert_chunks(chunks)
+        self.discard_pending()
+
+    def discard_pending(self):
+        shutil.rmtree(self._file("pending"), ignore_errors=True)
+
+    def _upsert_chunks(self, chunks):
+        ids = list(self.ids)
+        row_of = dict(self.row_of)
+        parts = [(self.vectors, None)] if self.vectors is not None else []
+
+        for chunk_ids, vectors in chunks:
+            rows = np.fromiter(
+                (row_of.get(paper_id, -1) for paper_id in chunk_ids),
+                dtype=np.int64,
+                count=len(chunk_ids),
+            )
+            new = rows < 0
+            for paper_id in (p for p, is_new in zip(chunk_ids, new) if is_new):
+                row_of[paper_id] = len(ids)
+                ids.append(paper_id)
+            # Appended parts are laid out in list order, after the existing rows
+            parts += [(vectors[~new], rows[~new]), (vectors[new], None)]
+
+        self._rewrite(ids, parts)
+
+    def _rewrite(self, ids, parts):
+        """
+        Writes a new matrix from `parts`, a list of (vectors, rows) pairs. Parts with
+        rows=None are appended in order; the others overwrite the given rows. The
+        files are swapped in only once fully written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        dim = next(v.shape[1] for v, _ in parts if v.ndim == 2 and v.shape[0])
+        tmp_path = self._file("vectors.tmp.npy")
+        out = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=self.dtype, shape=(len(ids), dim)
+        )
+
+        offset = 0
+        for vectors, rows in parts:
+            if rows is None:
+                for i in range(0, len(vectors), COPY_CHUNK_ROWS):
+                    chunk = vectors[i : i + COPY_CHUNK_ROWS]
+                    out[offset : offset + len(chunk)] = chunk
+                    offset += len(chunk)
+            elif len(rows):
+                out[rows] = vectors
+        out.flush()
+        del out
+
+        # Release our own mapping of the old file before replacing it
+        self.vectors = None
+        os.replace(tmp_path, self._file("vectors.npy"))
+        with open(self._file("ids.json"), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+        with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model_name": self.model_name,
+                    "dim": dim,
+                    "dtype": self.dtype.name,
+                    "count": len(ids),
+                    # Same row count, different rows: only the revision tells them apart
+                    "revision": uuid.uuid4().hex,
+                },
+                f,
+                indent=4,
+            )
+        self.load()
+        print(f"Embedding store {self.path} now holds {len(self.ids)} papers.")
@@ -0,0 +1,246 @@
+import os
+import csv
+import sys
+import math
+import time
+import itertools
+import statistics
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import train_test_split
+from torch_geometric.data import Data
+from src.gnn import GCN, driver, to_sparse_adjacency
+from src.embedding_store import EmbeddingStore
+from src.snapshot import EDGE_TYPES, load_snapshot, select_edges
+
+
+"""
+Parallel hyperparameter sweep of the GCN over one graph snapshot:
+
+1. 📦 Load the snapshot once and move its tensors to shared memory
+2. 🧵 Train every configuration (learning rate, hidden size, epochs, edge types) in
+   worker processes, each with its own thread budget
+3. ✂️ Stop runs whose best validation RMSE so far is worse than the median of the other
+   runs' best at the same epoch, and runs that diverge
+4. 📊 Write the test RMSE and wall time of each configuration to output/gnn_sweep.csv
+"""
+
+# ---------- CONFIG ---------- #
+LEARNING_RATES = [0.003, 0.008, 0.02]
+HIDDEN_CHANNELS = [32, 64, 128]
+EPOCHS = [1000]
+EDGE_TYPE_SETS = [EDGE_TYPES, ["CITES", "RELATED"], ["CITES"]]
+EVAL_EVERY = 20  # epochs between validation checks
+PRUNE_AFTER = 100  # epochs a run always gets before it can be stopped
+MIN_RUNS_TO_PRUNE = 3  # other runs needed at an epoch before comparing to their median
+PROCESSES = None  # worker processes, None uses cpu_count / 2
+OUTPUT_CSV = "output/gnn_sweep.csv"
+# ---------------------------- #
+
+
+def grid(
+    learning_rates=LEARNING_RATES,
+    hidden_channels=HIDDEN_CHANNELS,
+    epochs=EPOCHS,
+    edge_type_sets=EDGE_TYPE_SETS,
+):
+    return [
+        {"lr": lr, "hidden": hidden, "epochs": n, "edge_types": list(edge_types)}
+        for lr, hidden, n, edge_types in itertools.product(
+            learning_rates, hidden_channels, epochs, edge_type_sets
+        )
+    ]
+
+
+def split_masks(num_nodes, seed=42):
+    """
+    The train/test split of gnn.py, with 10% of the training papers held out for
+    validation.
+    """
+    train_idx, test_idx = train_test_split(
+        range(num_nodes), test_size=0.2, random_state=seed
+    )
+    fit_idx, val_idx = train_test_split(train_idx, test_size=0.1, random_state=seed)
+    masks = []
+    for idx in (fit_idx, val_idx, test_idx):
+        mask = torch.zeros(num_nodes, dtype=torch.bool)
+        mask[idx] = True
+        masks.append(mask)
+    return masks
+
+
+def shared_graph(snapshot, edge_type_sets):
+    """
+    The tensors every run needs, moved to shared memory so the worker processes map
+    them instead of receiving a copy each.
+    """
+    edge_types = sorted({t for edge_types in edge_type_sets for t in edge_types})
+    fit_mask, val_mask, test_mask = split_masks(snapshot["x"].shape[0])
+    graph = {
+        "x": snapshot["x"],
+        "y": snapshot["y"],
+        "fit_mask": fit_mask,
+        "val_mask": val_mask,
+        "test_mask": test_mask,
+        "edge_index_by_type": {t: select_edges(snapshot, [t]) for t in edge_types},
+    }
+    for tensor in [graph[k] for k in ("x", "y", "fit_mask", "val_mask", "test_mask")]:
+        tensor.share_memory_()
+    for tensor in graph["edge_index_by_type"].values():
+        tensor.share_memory_()
+    return graph
+
+
+# Shared graph and cross-run progress, set once in each worker process by _init_worker
+_graph = None
+_progress = None
+_lock = None
+_adjacency = {}  # edge types -> normalized adjacency, reused across the worker's runs
+
+
+def _init_worker(graph, progress, lock, threads):
+    global _graph, _progress, _lock
+    torch.set_num_threads(threads)
+    _graph, _progress, _lock = graph, progress, lock
+
+
+def _should_stop(epoch, rmse):
+    """
+    Median stopping rule: records the best validation RMSE of this run up to `epoch`
+    and tells whether it is worse than the median of the other runs' best at the same
+    epoch. Best-so-far values keep a noisy evaluation from stopping a good run.
+    """
+    with _lock:
+        others = _progress.get(epoch, [])
+        _progress[epoch] = others + [rmse]
+    return (
+        epoch >= PRUNE_AFTER
+        and len(others) >= MIN_RUNS_TO_PRUNE
+        and rmse > statistics.median(others)
+    )
+
+
+def _train_worker(config):
+    start = time.perf_counter()
+    key = tuple(config["edge_types"])
+    if key not in _adjacency:
+        data = Data(
+            edge_index=select_edges(_graph, key), num_nodes=_graph["x"].shape[0]
+        )
+        _adjacency[key] = to_sparse_adjacency(data)
+    adj_t = _adjacency[key]
+
+    x, y = _graph["x"], _graph["y"]
+    fit_mask, val_mask, test_mask = (
+        _graph["fit_mask"],
+        _graph["val_mask"],
+        _graph["test_mask"],
+    )
+    torch.manual_seed(0)
+    model = GCN(x.shape[1], config["hidden"], cached=True)
+    optimizer = torch.optim.Adam(model.parameters(), lr=config["lr"])
+
+    best = {"val_rmse": float("inf"), "test_rmse": None, "epoch": None}
+    status = "completed"
+    for epoch in range(config["epochs"]):
+        model.train()
+        optimizer.zero_grad()
+        out = model(x, adj_t)
+        loss = F.mse_loss(out[fit_mask], y[fit_mask])
+        loss.backward()
+        optimizer.step()
+
+        if epoch % EVAL_EVERY == 0 or epoch == config["epochs"] - 1:
+            model.eval()
+            with torch.no_grad():
+                pred = model(x, adj_t)
+                val_rmse = torch.sqrt(F.mse_loss(pred[val_mask], y[val_mask])).item()
+                if not math.isfinite(val_rmse):
+                    status = f"diverged at epoch {epoch}"
+                    break
+                if val_rmse < best["val_rmse"]:
+                    test_rmse = torch.sqrt(F.mse_loss(pred[test_mask], y[test_mask]))
+                    best = {
+                        "val_rmse": val_rmse,
+                        "test_rmse": test_rmse.item(),
+                        "epoch": epoch,
+                    }
+            if _should_stop(epoch, best["val_rmse"]):
+                status = f"pruned at epoch {epoch}"
+                break
+
+    return {
+        "lr": config["lr"],
+        "hidden": config["hidden"],
+        "epochs": config["epochs"],
+        "edge_types": "|".join(config["edge_types"]),
+        "best_epoch": best["epoch"],
+        # None if the run diverged before its first evaluation
+        "val_rmse": round(best["val_rmse"], 4) if best["epoch"] is not None else None,
+        "test_rmse": round(best["test_rmse"], 4) if best["epoch"] is not None else None,
+        "seconds": round(time.perf_counter() - start, 1),
+        "status": status,
+    }
+
+
+def run_sweep(snapshot, configs, processes=PROCESSES, output_csv_path=OUTPUT_CSV):
+    """
+    Trains every configuration on a pool of processes sharing the snapshot tensors,
+    and writes one row per configuration sorted by validation RMSE.
+    """
+    processes = processes or max(1, (os.cpu_count() or 1) // 2)
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    graph = shared_graph(snapshot, [c["edge_types"] for c in configs])
+    print(
+        f"Sweeping {len(configs)} configurations on {processes} processes "
+        f"x {threads} threads"
+    )
+
+    start = time.perf_counter()
+    context = mp.get_context("spawn")
+    with context.Manager() as manager:
+        progress, lock = manager.dict(), manager.Lock()
+        with ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(graph, progress, lock, threads),
+        ) as pool:
+            rows = []
+            for row in pool.map(_train_worker, configs):
+                print(
+                    f"lr={row['lr']} hidden={row['hidden']} edges={row['edge_types']}: "
+                    f"val RMSE {row['val_rmse']}, test RMSE {row['test_rmse']}, "
+                    f"{row['seconds']}s ({row['status']})"
+                )
+                rows.append(row)
+    print(f"Sweep finished in {time.perf_counter() - start:.1f}s")
+
+    rows.sort(
+        key=lambda row: row["val_rmse"] if row["val_rmse"] is not None else math.inf
+    )
+    if output_csv_path:
+        with open(output_csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Exported sweep results to {output_csv_path}")
+    return rows
+
+
+def main(processes=PROCESSES):
+    print("Loading graph snapshot...")
+    snapshot = load_snapshot(driver, EmbeddingStore())
+    rows = run_sweep(snapshot, grid(), processes)
+    best = rows[0]
+    print(
+        f"Best: lr={best['lr']} hidden={best['hidden']} edges={best['edge_types']} "
+        f"(val RMSE {best['val_rmse']}, test RMSE {best['test_rmse']})"
+    )
+
+
+if __name__ == "__main__":
+    # Optionally pass the number of worker processes
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else PROCESSES)
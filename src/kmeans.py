@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from threadpoolctl import threadpool_limits
+from sklearn.metrics import normalized_mutual_info_score, silhouette_score
+
+
+"""
+In-process mini-batch KMeans over the embedding store:
+
+1. 🎯 k-means++ initialisation on a sample, then vectorized mini-batch center updates
+2. 🧵 Restarts and a sweep over k run in parallel worker processes, each memory-mapping the store
+3. 📊 Every k is scored by inertia, silhouette on a sample and NMI against the paper topics
+"""
+
+# ---------- CONFIG ---------- #
+BATCH_SIZE = 2048
+MAX_ITER = 300
+TOL = 1e-4  # stop once no center moves more than this between batches
+INIT_SAMPLE = 20_000  # papers used for the k-means++ initialisation
+ASSIGN_BLOCK = 65_536  # rows assigned to their nearest center at once
+SILHOUETTE_SAMPLE = 10_000
+# ---------------------------- #
+
+
+def kmeans_plus_plus(X, k, rng):
+    centers = np.empty((k, X.shape[1]), dtype=np.float32)
+    centers[0] = X[rng.integers(len(X))]
+    closest = ((X - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        centers[i] = X[rng.choice(len(X), p=closest / closest.sum())]
+        closest = np.minimum(closest, ((X - centers[i]) ** 2).sum(axis=1))
+    return centers
+
+
+def assign(X, centers, block_rows=ASSIGN_BLOCK):
+    """
+    Nearest center of every row and its squared distance, computed block by block so
+    a memory-mapped X is never fully loaded.
+    """
+    labels = np.empty(len(X), dtype=np.int64)
+    distances = np.empty(len(X), dtype=np.float32)
+    center_sq = (centers**2).sum(axis=1)
+    for start in range(0, len(X), block_rows):
+        block = np.asarray(X[start : start + block_rows], dtype=np.float32)
+        d = (block**2).sum(axis=1, keepdims=True) - 2 * block @ centers.T + center_sq
+        labels[start : start + len(block)] = d.argmin(axis=1)
+        distances[start : start + len(block)] = np.maximum(d.min(axis=1), 0)
+    return labels, distances
+
+
+def minibatch_kmeans(X, k, seed=0, batch_size=BATCH_SIZE, max_iter=MAX_ITER, tol=TOL):
+    """
+    Mini-batch KMeans (Sculley, 2010): each center moves towards the mean of its
+    batch members with a per-center learning rate of 1 / (points seen so far).
+
+    Returns the centers, the label of every row and the inertia.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    sample = np.sort(rng.choice(n, size=min(n, INIT_SAMPLE), replace=False))
+    centers = kmeans_plus_plus(np.asarray(X[sample], dtype=np.float32), k, rng)
+    seen = np.zeros(k, dtype=np.float64)
+
+    for _ in range(max_iter):
+        batch = np.asarray(
+            X[np.sort(rng.choice(n, size=min(n, batch_size), replace=False))],
+            dtype=np.float32,
+        )
+        labels, _ = assign(batch, centers)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+
+        seen += counts
+        moved = counts > 0
+        rate = (counts[moved] / seen[moved])[:, None]
+        new_centers = centers.copy()
+        new_centers[moved] += rate * (
+            sums[moved] / counts[moved][:, None] - centers[moved]
+        )
+
+        shift = np.sqrt(((new_centers - centers) ** 2).sum(axis=1)).max()
+        centers = new_centers
+        if shift < tol:
+            break
+
+    labels, distances = assign(X, centers)
+    return centers, labels, float(distances.sum())
+
+
+def cluster_quality(
+    X, labels, topic_labels=None, seed=0, sample_size=SILHOUETTE_SAMPLE
+):
+    """
+    Silhouette on a random sample of rows and, when `topic_labels` is given (-1 for
+    papers without one), the NMI between the clusters and the topics.
+    """
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(len(X), size=min(len(X), sample_size), replace=False))
+    quality = {"silhouette": None, "nmi": None}
+    if len(np.unique(labels[sample])) > 1:
+        quality["silhouette"] = float(
+            silhouette_score(np.asarray(X[sample], dtype=np.float32), labels[sample])
+        )
+    if topic_labels is not None:
+        known = topic_labels >= 0
+        quality["nmi"] = float(
+            normalized_mutual_info_score(topic_labels[known], labels[known])
+        )
+    return quality
+
+
+def _fit_worker(args):
+    vectors_path, k, seed, threads = args
+    with threadpool_limits(threads):
+        # Only the vectors: the store's ids and paper_id index would be loaded again
+        # by every worker
+        X = np.load(vectors_path, mmap_mode="r")
+        centers, _, inertia = minibatch_kmeans(X, k, seed=seed)
+    return k, seed, centers, inertia
+
+
+def sweep(store, ks, restarts=3, processes=None, topic_labels=None):
+    """
+    Fits every k in `ks` `restarts` times on a pool of processes, keeps the restart
+    with the lowest inertia for each k and scores it.
+
+    Returns one result per k ({"k", "inertia", "silhouette", "nmi", "labels"}).
+    """
+    processes = processes or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    tasks = [
+        (store.vectors_path, k, seed, threads) for k in ks for seed in range(restarts)
+    ]
+
+    best = {}
+    with ProcessPoolExecutor(
+        max_workers=processes, mp_context=get_context("spawn")
+    ) as pool:
+        for k, seed, centers, inertia in pool.map(_fit_worker, tasks):
+            print(f"k={k} restart={seed}: inertia {inertia:.1f}")
+            if k not in best or inertia < best[k][1]:
+                best[k] = (centers, inertia)
+
+    results = []
+    for k in ks:
+        centers, inertia = best[k]
+        labels, _ = assign(store.vectors, centers)
+        quality = cluster_quality(store.vectors, labels, topic_labels)
+        results.append({"k": k, "inertia": inertia, **quality, "labels": labels})
+        print(
+            f"k={k}: inertia {inertia:.1f}, silhouette {quality['silhouette']}, NMI {quality['nmi']}"
+        )
+    return results
@@ -0,0 +1,367 @@
+import os
+import json
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from src import metrics
+from src.embedding_store import EmbeddingStore
+
+try:
+    import hnswlib
+except ImportError:  # Approximate search is optional
+    hnswlib = None
+
+
+"""
+In-process KNN over the normalized abstract embeddings, used to build SIMILAR_TO
+edges without a GDS-enabled server:
+
+1. 📥 Read the embeddings of all Paper nodes from the shared embedding store
+2. 🧮 Exact cosine top-k with blocked matrix multiplies (or an HNSW index for large corpora)
+3. 💾 Persist the index on disk so single papers can be queried against the corpus
+4. 🔗 Write SIMILAR_TO relationships with their `score` in batches
+
+Incremental runs refresh the persisted index and only query and rewrite the edges of
+the new or re-embedded papers; the whole corpus is searched again when the model or
+the kind of index changes.
+"""
+
+# ---------- CONFIG ---------- #
+TOP_K = 10
+MEMORY_BUDGET = 1 << 30  # bytes of similarity blocks held in memory at once
+# Per entry of a block: its float32 score and the int64 index argpartition returns
+BYTES_PER_SCORE = 12
+WRITE_BATCH_SIZE = 1000  # source papers per write transaction
+INDEX_DIR = "models/knn_index"
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 100
+# ---------------------------- #
+
+
+def normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _top_k_rows(scores, k):
+    """
+    Returns the column indices and values of the k largest entries of each row, sorted.
+    `scores` is negated in place, so no copy as large as it is made.
+    """
+    k = min(k, scores.shape[1])
+    negated = np.negative(scores, out=scores)
+    idx = np.argpartition(negated, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(negated, idx, axis=1)
+    order = np.argsort(vals, axis=1)
+    return np.take_along_axis(idx, order, axis=1), -np.take_along_axis(
+        vals, order, axis=1
+    )
+
+
+def exact_top_k(
+    embeddings, k=TOP_K, n_threads=None, memory_budget=MEMORY_BUDGET, rows=None
+):
+    """
+    Exact cosine top-k of every row (or of `rows` only) against all other rows.
+
+    Rows are processed in blocks sized so that the similarity blocks of all threads
+    together stay within `memory_budget` bytes. NumPy releases the GIL inside the
+    matrix multiply, so blocks run in parallel on a thread pool.
+    """
+    n = embeddings.shape[0]
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    k = min(k, n - 1)
+    n_threads = n_threads or os.cpu_count() or 1
+    block_size = max(
+        1, min(len(rows), memory_budget // (BYTES_PER_SCORE * n * n_threads))
+    )
+
+    indices = np.empty((len(rows), k), dtype=np.int64)
+    scores = np.empty((len(rows), k), dtype=np.float32)
+
+    def run_block(start):
+        stop = min(start + block_size, len(rows))
+        sims = embeddings[rows[start:stop]] @ embeddings.T
+        # Never return a paper as its own neighbour
+        sims[np.arange(stop - start), rows[start:stop]] = -np.inf
+        indices[start:stop], scores[start:stop] = _top_k_rows(sims, k)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        blocks = range(0, len(rows), block_size)
+        list(tqdm(pool.map(run_block, blocks), total=len(blocks), desc="Exact KNN"))
+
+    return indices, scores
+
+
+class KNNIndex:
+    """
+    Cosine-similarity index over the paper embeddings.
+
+    The exact index is the normalized embedding matrix itself; the approximate one
+    adds an HNSW graph (requires `hnswlib`). Both can be saved to and loaded from
+    `INDEX_DIR`, with the matrix memory-mapped on load.
+    """
+
+    def __init__(self, ids, embeddings, hnsw=None, model_name=None):
+        self.ids = list(ids)
+        self.embeddings = embeddings
+        self.hnsw = hnsw
+        self.model_name = model_name
+
+    @classmethod
+    def build(cls, ids, embeddings, approximate=False, n_threads=None, model_name=None):
+        embeddings = normalize(np.asarray(embeddings, dtype=np.float32))
+        hnsw = None
+        if approximate:
+            if hnswlib is None:
+                raise ImportError(
+                    "Approximate KNN requires hnswlib (pip install hnswlib)"
+                )
+            hnsw = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+            hnsw.init_index(
+                max_elements=embeddings.shape[0],
+                ef_construction=HNSW_EF_CONSTRUCTION,
+                M=HNSW_M,
+            )
+            hnsw.add_items(
+                embeddings, np.arange(embeddings.shape[0]), num_threads=n_threads or -1
+            )
+            hnsw.set_ef(HNSW_EF_SEARCH)
+        return cls(ids, embeddings, hnsw, model_name)
+
+    def save(self, path=INDEX_DIR):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "embeddings.npy"), self.embeddings)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"model_name": self.model_name}, f)
+        if self.hnsw is not None:
+            self.hnsw.save_index(os.path.join(path, "hnsw.bin"))
+        print(f"Saved KNN index ({len(self.ids)} papers) to {path}")
+
+    @classmethod
+    def load(cls, path=INDEX_DIR):
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        model_name = None
+        if os.path.exists(os.path.join(path, "meta.json")):
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                model_name = json.load(f)["model_name"]
+
+        hnsw = None
+        hnsw_path = os.path.join(path, "hnsw.bin")
+        if os.path.exists(hnsw_path) and hnswlib is not None:
+            hnsw = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+            hnsw.load_index(hnsw_path, max_elements=embeddings.shape[0])
+            hnsw.set_ef(HNSW_EF_SEARCH)
+        return cls(ids, embeddings, hnsw, model_name)
+
+    def refresh(self, ids, embeddings, rows, n_threads=None):
+        """
+        Updates the index to `ids` and `embeddings` (the current store), where only
+        the papers at `rows` are new or changed and every other paper keeps its row.
+        The HNSW graph gets those rows (re)inserted instead of being rebuilt.
+        """
+        self.ids = list(ids)
+        self.embeddings = normalize(np.asarray(embeddings, dtype=np.float32))
+        if self.hnsw is not None and len(rows):
+            if len(self.ids) > self.hnsw.get_max_elements():
+                self.hnsw.resize_index(len(self.ids))
+            # Existing labels are updated in place
+            self.hnsw.add_items(
+                self.embeddings[rows], rows, num_threads=n_threads or -1
+            )
+
+    def query(self, vectors, k=TOP_K):
+        """
+        Returns, for each query vector, the ids and scores of its k most similar papers.
+        """
+        vectors = normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+        k = min(k, len(self.ids))
+        if self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(vectors, k=k)
+            scores = 1.0 - distances
+        else:
+            labels, scores = _top_k_rows(vectors @ self.embeddings.T, k)
+
+        return [
+            ([self.ids[j] for j in row_labels], row_scores.tolist())
+            for row_labels, row_scores in zip(labels, scores)
+        ]
+
+    def all_top_k(self, k=TOP_K, n_threads=None, rows=None):
+        """
+        Top-k neighbours of every indexed paper (or of the papers at `rows`),
+        excluding the paper itself.
+        """
+        if self.hnsw is None:
+            return exact_top_k(self.embeddings, k=k, n_threads=n_threads, rows=rows)
+
+        rows = np.arange(len(self.ids)) if rows is None else np.asarray(rows)
+        k = min(k, len(self.ids) - 1)
+        # Ask for one extra neighbour, since each paper usually finds itself first
+        labels, distances = self.hnsw.knn_query(
+            self.embeddings[rows],
+            k=min(k + 1, len(self.ids)),
+            num_threads=n_threads or -1,
+        )
+        indices = np.empty((len(rows), k), dtype=np.int64)
+        scores = np.empty((len(rows), k), dtype=np.float32)
+        for i, (row, row_labels, row_distances) in enumerate(
+            zip(rows, labels, distances)
+        ):
+            keep = row_labels != row
+            indices[i] = row_labels[keep][:k]
+            scores[i] = 1.0 - row_distances[keep][:k]
+        return indices, scores
+
+
+def _write_similar_batch(tx, rows):
+    tx.run(
+        """
+        UNWIND $rows AS row
+        MATCH (src:Paper {paper_id: row.source})
+        CALL {
+            WITH src
+            MATCH (src)-[old:SIMILAR_TO]->()
+            DELETE old
+        }
+        WITH src, row
+        UNWIND range(0, size(row.targets) - 1) AS i
+        MATCH (tgt:Paper {paper_id: row.targets[i]})
+        CREATE (src)-[:SIMILAR_TO {score: row.scores[i]}]->(tgt)
+        """,
+        rows=rows,
+    )
+
+
+def write_similar_to(
+    driver, ids, indices, scores, batch_size=WRITE_BATCH_SIZE, sources=None
+):
+    """
+    Replaces the outgoing SIMILAR_TO relationships of every source paper with its
+    top-k neighbours, `batch_size` source papers per write transaction. Row i of
+    `indices` and `scores` belongs to sources[i] (by default ids[i]), and the
+    neighbours are positions in `ids`.
+    """
+    sources = ids if sources is None else sources
+    start = time.perf_counter()
+    with driver.session() as session:
+        for i in tqdm(range(0, len(sources), batch_size), desc="Writing SIMILAR_TO"):
+            rows = [
+                {
+                    "source": sources[row],
+                    "targets": [ids[j] for j in indices[row]],
+                    "scores": scores[row].tolist(),
+                }
+                for row in range(i, min(i + batch_size, len(sources)))
+            ]
+            metrics.execute_write(
+                session, _write_similar_batch, rows, query="similar_to"
+            )
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {indices.size} SIMILAR_TO relationships in {elapsed:.1f}s "
+        f"({len(sources) / max(elapsed, 1e-9):.0f} papers/s)."
+    )
+
+
+def build_similarity_edges(
+    driver, store, k=TOP_K, approximate=False, n_threads=None, index_dir=INDEX_DIR
+):
+    """
+    Builds the KNN index over all papers in the embedding store, saves it to
+    `index_dir` and writes the SIMILAR_TO relationships.
+    """
+    ids = store.ids
+    if len(ids) < 2:
+        print("Not enough embedded papers to compute similarities.")
+        return None
+
+    print(f"Building {'approximate' if approximate else 'exact'} KNN index...")
+    start = time.perf_counter()
+    index = KNNIndex.build(
+        ids,
+        store.vectors,
+        approximate=approximate,
+        n_threads=n_threads,
+        model_name=store.model_name,
+    )
+    indices, scores = index.all_top_k(k=k, n_threads=n_threads)
+    print(
+        f"Computed top-{k} neighbours of {len(ids)} papers in {time.perf_counter() - start:.1f}s."
+    )
+
+    index.save(index_dir)
+    write_similar_to(driver, ids, indices, scores)
+    return index
+
+
+def update_similarity_edges(
+    driver,
+    store,
+    paper_ids,
+    k=TOP_K,
+    approximate=False,
+    n_threads=None,
+    index_dir=INDEX_DIR,
+):
+    """
+    Incremental build_similarity_edges: refreshes the index saved in `index_dir` with
+    the store and rewrites the SIMILAR_TO relationships of `paper_ids` (the papers
+    embedded since it was saved) only. The other papers keep their edges, so a new
+    paper only shows up among their neighbours after a full rebuild.
+
+    Falls back to build_similarity_edges when there is no saved index for the store's
+    model and kind of search, or the store no longer extends the indexed papers.
+    """
+    index = None
+    if os.path.exists(os.path.join(index_dir, "ids.json")):
+        index = KNNIndex.load(index_dir)
+    if (
+        index is None
+        or index.model_name != store.model_name
+        or (index.hnsw is not None) != approximate
+        or store.ids[: len(index.ids)] != index.ids
+    ):
+        return build_similarity_edges(
+            driver, store, k, approximate, n_threads, index_dir
+        )
+
+    rows = store.rows(paper_ids)
+    rows = np.union1d(rows[rows >= 0], np.arange(len(index.ids), len(store.ids)))
+    if not len(rows):
+        print("No new or re-embedded papers to link.")
+        return index
+
+    start = time.perf_counter()
+    index.refresh(store.ids, store.vectors, rows, n_threads=n_threads)
+    indices, scores = index.all_top_k(k=k, n_threads=n_threads, rows=rows)
+    print(
+        f"Computed top-{k} neighbours of {len(rows)} papers in {time.perf_counter() - start:.1f}s."
+    )
+
+    index.save(index_dir)
+    write_similar_to(
+        driver, index.ids, indices, scores, sources=[index.ids[r] for r in rows]
+    )
+    return index
+
+
+if __name__ == "__main__":
+    import sys
+    from neo4j import GraphDatabase
+
+    URI = "bolt://localhost:7687"
+    AUTH = ("neo4j", "trendgraph")
+
+    with GraphDatabase.driver(URI, auth=AUTH) as driver:
+        # Pass --approximate to use an HNSW index instead of the exact search
+        build_similarity_edges(
+            driver, EmbeddingStore(), approximate="--approximate" in sys.argv
+        )
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+
+"""
+Shared instrumentation for the pipeline scripts:
+
+1. 🔢 Counters, gauges and histograms, labelled like Prometheus metrics
+2. ⏱️ timer() records a duration histogram, span() also logs the timed block as an event
+3. 📝 Events go to output/metrics/events.jsonl, one JSON object per line
+4. 📈 A Prometheus text snapshot of every metric is written to output/metrics/<job>.prom
+   every SNAPSHOT_INTERVAL seconds and when the process exits
+
+The job is the running script (e.g. `similarities`), so every stage of the pipeline
+keeps its own snapshot. Pool workers exit without running atexit, so metrics are
+recorded in the parent process.
+"""
+
+# ---------- CONFIG ---------- #
+METRICS_DIR = "output/metrics"
+EVENTS_FILE = "events.jsonl"
+SNAPSHOT_INTERVAL = 60  # seconds between snapshots of long-running jobs
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
+# ---------------------------- #
+
+
+def _default_job():
+    main = sys.modules.get("__main__")
+    spec = getattr(main, "__spec__", None)
+    name = spec.name if spec else os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    return name.rsplit(".", 1)[-1] or "python"
+
+
+class Registry:
+    def __init__(self, job=None, directory=METRICS_DIR):
+        self.job = job or _default_job()
+        self.directory = directory
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}  # key -> [bucket bounds, bucket counts, sum, count]
+        self._lock = threading.Lock()
+        self._spans = threading.local()
+        self._last_snapshot = time.monotonic()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def _maybe_snapshot(self):
+        if multiprocessing.parent_process() is not None:
+            return  # A worker would overwrite the snapshot of the job that started it
+        if time.monotonic() - self._last_snapshot >= SNAPSHOT_INTERVAL:
+            self._last_snapshot = time.monotonic()
+            self.write_snapshot()
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._maybe_snapshot()
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+        self._maybe_snapshot()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.setdefault(
+                key, [list(buckets), [0] * len(buckets), 0.0, 0]
+            )
+            for i, bound in enumerate(histogram[0]):
+                if value <= bound:
+                    histogram[1][i] += 1
+            histogram[2] += value
+            histogram[3] += 1
+        self._maybe_snapshot()
+
+    def event(self, kind, **fields):
+        record = {
+            "ts": round(time.time(), 3),
+            "job": self.job,
+            "pid": os.getpid(),
+            "event": kind,
+            **fields,
+        }
+        line = json.dumps(record, default=str)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(
+                os.path.join(self.directory, EVENTS_FILE), "a", encoding="utf-8"
+            ) as f:
+                f.write(line + "\n")
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the duration of the block in the `<name>_seconds` histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Like timer(), and also logs a `span` event with the duration, the outcome and
+        the enclosing span of this thread.
+        """
+        stack = self._spans.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException as e:
+            status = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            seconds = time.perf_counter() - start
+            self.observe(f"{name}_seconds", seconds, **labels)
+            self.event(
+                "span",
+                span=name,
+                parent=parent,
+                seconds=round(seconds, 4),
+                status=status,
+                **labels,
+            )
+
+    def _lines(self):
+        def fmt(labels, extra=()):
+            pairs = [("job", self.job), *labels, *extra]
+            escaped = (
+                (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                for k, v in pairs
+            )
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        lines = []
+        for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            for name in sorted({name for name, _ in metrics}):
+                lines.append(f"# TYPE {name} {kind}")
+                for (n, labels), value in sorted(metrics.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (n, labels), (bounds, counts, total, count) in sorted(
+                self.histograms.items()
+            ):
+                if n != name:
+                    continue
+                for bound, bucket_count in zip(bounds, counts):
+                    le = fmt(labels, [("le", str(bound))])
+                    lines.append(f"{name}_bucket{le} {bucket_count}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{fmt(labels)} {total}")
+                lines.append(f"{name}_count{fmt(labels)} {count}")
+        return lines
+
+    def write_snapshot(self, path=None):
+        """Writes every metric in the Prometheus text format (atomically replaced)."""
+        path = path or os.path.join(self.directory, f"{self.job}.prom")
+        with self._lock:
+            if not (self.counters or self.gauges or self.histograms):
+                return None
+            text = "\n".join(self._lines()) + "\n"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+        return path
+
+
+registry = Registry()
+atexit.register(registry.write_snapshot)
+
+inc = registry.inc
+set_gauge = registry.set_gauge
+observe = registry.observe
+event = registry.event
+timer = registry.timer
+span = registry.span
+write_snapshot = registry.write_snapshot
+
+
+@contextmanager
+def neo4j_query(query, mode="read"):
+    """
+    Counts and times the block under the `query` label like a transaction. Used
+    around bare session.run calls and GDS procedures: the block must also consume
+    the result, since rows are streamed while it is read.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        observe(
+            "neo4j_transaction_seconds",
+            time.perf_counter() - start,
+            query=query,
+            mode=mode,
+        )
+        inc("neo4j_transactions_total", query=query, mode=mode, status=status)
+
+
+def _transaction(execute, mode, query, work, args):
+    with neo4j_query(query, mode):
+        return execute(work, *args)
+
+
+def execute_write(session, work, *args, query):
+    """session.execute_write, counted and timed under the `query` label."""
+    return _transaction(session.execute_write, "write", query, work, args)
+
+
+def execute_read(session, work, *args, query):
+    """session.execute_read, counted and timed under the `query` label."""
+    return _transaction(session.execute_read, "read", query, work, args)
@@ -0,0 +1,111 @@
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from src.synthetic import SyntheticOpenAlex
+
+
+"""
+Local stand-in for the OpenAlex endpoints PaperRetriever calls, serving a synthetic corpus:
+
+- GET /works?cursor=...&per_page=...    cursor pagination over the first `listed` works
+- GET /works?filter=cites:W<n>           works citing W<n> (the cited_by_api_url)
+- GET /works/W<n>                        a single work (related works are fetched this way)
+"""
+
+# ---------- CONFIG ---------- #
+HOST = "127.0.0.1"
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 200
+# ---------------------------- #
+
+
+def make_handler(corpus, listed):
+    class OpenAlexHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _work_index(self, key):
+            if not key.startswith("W") or not key[1:].isdigit():
+                return None
+            i = int(key[1:])
+            return i if i < corpus.num_works else None
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            parts = url.path.strip("/").split("/")
+
+            if parts == ["works"]:
+                cites = params.get("filter", "")
+                if cites.startswith("cites:"):
+                    i = self._work_index(cites[len("cites:") :])
+                    if i is None:
+                        return self._send(404, {"error": "Not found"})
+                    results = corpus.citing(i)
+                    return self._send(
+                        200, {"meta": {"count": len(results)}, "results": results}
+                    )
+
+                # The cursor is the offset of the page; "*" starts from the beginning,
+                # and past the last work the results are empty and next_cursor is null
+                cursor = params.get("cursor", "*")
+                offset = 0 if cursor == "*" else int(cursor)
+                per_page = min(
+                    int(params.get("per_page", DEFAULT_PER_PAGE)), MAX_PER_PAGE
+                )
+                results = list(corpus.works(offset, min(offset + per_page, listed)))
+                next_cursor = str(offset + per_page) if results else None
+                return self._send(
+                    200,
+                    {
+                        "meta": {"count": listed, "next_cursor": next_cursor},
+                        "results": results,
+                    },
+                )
+
+            if len(parts) == 2 and parts[0] == "works":
+                i = self._work_index(parts[1])
+                if i is None:
+                    return self._send(404, {"error": "Not found"})
+                return self._send(200, corpus.work(i))
+
+            self._send(404, {"error": "Not found"})
+
+        def log_message(self, format, *args):
+            pass  # One line per request would drown the crawler's output
+
+    return OpenAlexHandler
+
+
+def serve(num_works, listed=None, seed=0, port=0):
+    """
+    Starts the stand-in on a background thread. `listed` works (all by default) are
+    paginated by /works; every work can be fetched by id.
+
+    Returns the server and the base URL to use as PaperRetriever's OpenAlex URL.
+    """
+    server = ThreadingHTTPServer((HOST, port), None)
+    base_url = f"http://{HOST}:{server.server_address[1]}"
+    corpus = SyntheticOpenAlex(num_works, seed=seed, base_url=base_url)
+    server.RequestHandlerClass = make_handler(corpus, listed or num_works)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{base_url}/works"
+
+
+if __name__ == "__main__":
+    # Optionally pass the corpus size and the port
+    num_works = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server, url = serve(num_works, port=port)
+    print(f"Serving {num_works} synthetic works at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
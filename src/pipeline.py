@@ -0,0 +1,323 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src import metrics
+
+
+"""
+Incremental orchestrator of the TrendGraph steps:
+
+1. 🗺️ The stages form a DAG through the artifacts they declare as inputs and outputs
+2. 🔑 Each stage is fingerprinted from its script and its inputs, and skipped when the
+   fingerprint matches its last successful run and its output files still exist
+3. 📥 On a checkout without recorded state, a stage whose output files already exist
+   is adopted instead of rerun (so an existing crawl is never repeated)
+4. 🛑 Destructive stages (build_graph wipes the database) only run when forced
+5. 🧵 Stages whose inputs are ready run in parallel as subprocesses
+6. ⏱️ The duration of every stage is recorded in data/pipeline_state.json, and as a
+   `pipeline_stage` span in output/metrics
+
+Artifacts are file or directory paths, or `neo4j:<name>` for state kept in the
+database. The fingerprint of a Neo4j artifact is the fingerprint and time of the
+stage run that produced it, so downstream stages rerun whenever it is rebuilt.
+"""
+
+# ---------- CONFIG ---------- #
+STATE_PATH = "data/pipeline_state.json"
+MAX_PARALLEL = 3  # stages running at the same time
+# ---------------------------- #
+
+
+class Stage:
+    def __init__(self, name, command, inputs, outputs, destructive=False):
+        self.name = name
+        self.command = command  # arguments after `python`
+        self.inputs = inputs
+        self.outputs = outputs
+        self.destructive = destructive  # only runs when named in `force`
+
+    @property
+    def file_outputs(self):
+        return [a for a in self.outputs if not a.startswith("neo4j:")]
+
+    @property
+    def script(self):
+        """Source file of the stage, so code changes also invalidate it."""
+        if self.command[0] == "-m":
+            return self.command[1].replace(".", os.sep) + ".py"
+        return self.command[0]
+
+
+STAGES = [
+    Stage(
+        "retrieve",
+        ["-m", "src.preprocess"],
+        inputs=["src/openalex.py"],
+        outputs=["data/openalex_research_papers.json"],
+    ),
+    Stage(
+        "build_graph",
+        ["-m", "src.build_graph"],
+        inputs=["data/openalex_research_papers.json"],
+        outputs=["neo4j:graph"],
+        destructive=True,  # starts with MATCH (n) DETACH DELETE n
+    ),
+    Stage(
+        "similarities",
+        ["-m", "src.similarities"],
+        inputs=["neo4j:graph", "src/embedding.py", "src/knn.py"],
+        outputs=["neo4j:embeddings", "neo4j:similar_to", "data/embeddings"],
+    ),
+    Stage(
+        "queries",
+        ["-m", "src.queries"],
+        inputs=["neo4j:graph", "neo4j:similar_to"],
+        outputs=[
+            "output/most_popular_topics.csv",
+            "output/emerging_topics.csv",
+            "output/most_influential_topics.csv",
+            "output/most_influential_authors_by_topic.csv",
+            "output/top_authors_involved_in_similar_papers.csv",
+        ],
+    ),
+    Stage(
+        "trends",
+        ["-m", "src.trends"],
+        inputs=["output/emerging_topics.csv"],
+        outputs=["output/topic_trends.csv"],
+    ),
+    Stage(
+        "visualize",
+        ["visualization/emerging_topics.py"],
+        inputs=["output/emerging_topics.csv", "output/topic_trends.csv"],
+        outputs=["output/emerging_topics_growth.png"],
+    ),
+    Stage(
+        "clusters",
+        ["-m", "src.clusters"],
+        inputs=["neo4j:embeddings", "data/embeddings", "src/kmeans.py"],
+        outputs=[
+            "neo4j:clusters",
+            "output/kmeans_sweep.csv",
+            "output/topic_distribution_per_cluster.csv",
+            "output/cluster_summary.csv",
+        ],
+    ),
+    Stage(
+        "gnn",
+        ["-m", "src.gnn"],
+        inputs=["neo4j:similar_to", "data/embeddings", "src/snapshot.py"],
+        outputs=[
+            "models/gnn_model.pth",
+            "models/gnn_stats.pt",
+            "output/example_predictions.txt",
+        ],
+    ),
+    Stage(
+        "predict",
+        ["-m", "src.predict"],
+        inputs=["models/gnn_model.pth", "models/gnn_stats.pt"],
+        outputs=["neo4j:predictions"],
+    ),
+]
+
+
+def file_fingerprint(path):
+    """
+    SHA-1 of a file's content, or of the names, sizes and modification times of the
+    files under a directory (None if the path does not exist).
+    """
+    if os.path.isfile(path):
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    if os.path.isdir(path):
+        entries = []
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                entries.append(
+                    [os.path.join(root, name), stat.st_size, stat.st_mtime_ns]
+                )
+        key = json.dumps(sorted(entries))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return None
+
+
+class Pipeline:
+    def __init__(self, stages=STAGES, state_path=STATE_PATH, max_parallel=MAX_PARALLEL):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.max_parallel = max_parallel
+        self.producer = {
+            artifact: stage.name for stage in stages for artifact in stage.outputs
+        }
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4)
+
+    def dependencies(self, name):
+        """Stages producing an input of `name`."""
+        return {
+            self.producer[artifact]
+            for artifact in self.stages[name].inputs
+            if artifact in self.producer
+        }
+
+    def upstream(self, names):
+        """`names` and every stage they depend on, directly or not."""
+        selected, frontier = set(), list(names)
+        while frontier:
+            name = frontier.pop()
+            if name not in selected:
+                selected.add(name)
+                frontier.extend(self.dependencies(name))
+        return selected
+
+    def artifact_fingerprint(self, artifact, state):
+        if artifact.startswith("neo4j:"):
+            # Changes whenever the producing stage runs, even with the same inputs
+            run = state.get(self.producer.get(artifact), {})
+            return [run.get("fingerprint"), run.get("finished_at")]
+        return file_fingerprint(artifact)
+
+    def fingerprint(self, name, state):
+        stage = self.stages[name]
+        inputs = {
+            artifact: self.artifact_fingerprint(artifact, state)
+            for artifact in [stage.script, *stage.inputs]
+        }
+        key = json.dumps({"command": stage.command, "inputs": inputs}, sort_keys=True)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def is_fresh(self, name, state):
+        """The inputs are unchanged since the last successful run and the outputs exist."""
+        stage = self.stages[name]
+        return state.get(name, {}).get("fingerprint") == self.fingerprint(
+            name, state
+        ) and all(os.path.exists(artifact) for artifact in stage.file_outputs)
+
+    def is_adoptable(self, name, state, status=None):
+        """
+        The stage never ran under this state file but all its output files exist, e.g.
+        on a fresh checkout next to existing data. Outputs are not adopted once a
+        dependency ran (or would run) in this invocation (`status`), since they were
+        built from the inputs it just replaced.
+        """
+        stage = self.stages[name]
+        return (
+            name not in state
+            and not any(
+                (status or {}).get(d) in ("ran", "would run")
+                for d in self.dependencies(name)
+            )
+            and bool(stage.file_outputs)
+            and all(os.path.exists(artifact) for artifact in stage.file_outputs)
+        )
+
+    def _run_stage(self, name):
+        stage = self.stages[name]
+        start = time.perf_counter()
+        with metrics.span("pipeline_stage", stage=name):
+            result = subprocess.run([sys.executable, *stage.command])
+        metrics.inc(
+            "pipeline_stage_runs_total",
+            stage=name,
+            status="ok" if result.returncode == 0 else "failed",
+        )
+        return result.returncode, time.perf_counter() - start
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """
+        Runs `targets` (all stages by default) and the stages they depend on, skipping
+        the ones that are fresh or adoptable unless they are in `force`. Destructive
+        stages are held unless they are in `force`, and their dependents go on with the
+        existing state. A stage is only checked once all its dependencies finished,
+        since their outputs are its inputs.
+
+        Returns the status of every selected stage.
+        """
+        selected = self.upstream(targets or self.stages)
+        state = self._load_state()
+        status = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            while len(status) < len(selected):
+                for name in sorted(selected - set(status) - set(running.values())):
+                    deps = self.dependencies(name) & selected
+                    if any(d not in status for d in deps):
+                        continue
+                    if any(status[d] in ("failed", "blocked") for d in deps):
+                        status[name] = "blocked"
+                    elif dry_run and any(status[d] == "would run" for d in deps):
+                        status[name] = "would run"
+                        print(f"▶️  {name}: would run")
+                    elif name not in force and self.is_fresh(name, state):
+                        status[name] = "skipped"
+                        print(f"⏭️  {name}: inputs unchanged, skipping")
+                    elif name not in force and self.is_adoptable(name, state, status):
+                        status[name] = "adopted"
+                        print(f"📥 {name}: outputs already exist, adopting them")
+                        if not dry_run:
+                            state[name] = {
+                                "fingerprint": self.fingerprint(name, state),
+                                "seconds": None,
+                                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                "adopted": True,
+                            }
+                            self._save_state(state)
+                    elif self.stages[name].destructive and name not in force:
+                        status[name] = "held"
+                        print(
+                            f"🛑 {name}: not run, it deletes existing data. "
+                            f"Pass `{name} --force` to run it"
+                        )
+                    elif dry_run:
+                        status[name] = "would run"
+                        print(f"▶️  {name}: would run")
+                    else:
+                        print(f"▶️  {name}: running")
+                        running[pool.submit(self._run_stage, name)] = name
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    returncode, seconds = future.result()
+                    if returncode != 0:
+                        status[name] = "failed"
+                        print(f"❌ {name}: failed with exit code {returncode}")
+                        continue
+                    status[name] = "ran"
+                    # Fingerprint once its dependencies' entries are final
+                    state[name] = {
+                        "fingerprint": self.fingerprint(name, state),
+                        "seconds": round(seconds, 1),
+                        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    }
+                    self._save_state(state)
+                    print(f"✅ {name}: {seconds:.1f}s")
+
+        print("\nStage           Status      Last duration")
+        for name in self.stages:
+            if name in selected:
+                seconds = state.get(name, {}).get("seconds")
+                duration = f"{seconds:.1f}s" if seconds is not None else "-"
+                print(f"{name:<15} {status[name]:<11} {duration}")
+        return status
@@ -0,0 +1,201 @@
+import sys
+import time
+import torch
+from tqdm import tqdm
+from neo4j import GraphDatabase
+from src import metrics
+from src.gnn import GCN
+from src.embedding_store import EmbeddingStore
+
+
+"""
+Batch citation prediction with the GCN saved by gnn.py:
+
+1. 📦 Load the model and its normalization stats once
+2. 🔎 Find the papers without a prediction, or whose embedding changed since it was made
+3. 🕸️ Fetch the 2-hop incoming neighbourhood of each batch (the GCN has two layers)
+4. 💾 Write `predicted_citations` back to the Paper nodes in chunks
+"""
+
+# ---------- CONFIG ---------- #
+URI = "bolt://localhost:7687"
+AUTH = ("neo4j", "trendgraph")
+MODEL_PATH = "models/gnn_model.pth"
+STATS_PATH = "models/gnn_stats.pt"
+BATCH_SIZE = 1000  # papers scored per forward pass
+FANOUT = 25  # incoming neighbours fetched per paper and hop
+WRITE_BATCH_SIZE = 5000  # predictions per write transaction
+# ---------------------------- #
+
+driver = GraphDatabase.driver(URI, auth=AUTH)
+
+
+class CitationPredictor:
+    """
+    Wraps the trained GCN together with the feature normalization used in training.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, stats_path=STATS_PATH):
+        state_dict = torch.load(model_path)
+        stats = torch.load(stats_path)
+        self.mean, self.std = stats["mean"], stats["std"]
+        self.edge_types = stats["edge_types"]
+        self.store = EmbeddingStore(stats["model_name"])
+
+        self.model = GCN(self.mean.shape[0], stats.get("hidden_channels", 64))
+        self.model.load_state_dict(state_dict)
+        self.model.eval()
+
+    def features(self, paper_ids, years):
+        """Normalized [embedding, year] rows, in the same layout as the training snapshot."""
+        embeddings = torch.from_numpy(self.store.get(paper_ids))
+        x = torch.cat(
+            [embeddings, torch.tensor(years, dtype=torch.float).unsqueeze(1)], 1
+        )
+        return (x - self.mean) / self.std
+
+    @torch.no_grad()
+    def predict(self, x, edge_index, targets):
+        """Predicted citations of the `targets` rows of a local subgraph."""
+        return torch.expm1(self.model(x, edge_index)[targets])
+
+
+def fetch_papers_to_score(score_all=False):
+    """
+    Ids and embedding hashes of the papers whose prediction is missing or was made
+    from an older embedding (or of every embedded paper with `score_all`).
+    """
+    with driver.session() as session, metrics.neo4j_query("papers_to_score"):
+        result = session.run(
+            """
+            MATCH (p:Paper)
+            WHERE p.embedding IS NOT NULL AND p.year IS NOT NULL
+              AND ($score_all
+                   OR p.predicted_citations IS NULL
+                   OR p.predicted_from IS NULL
+                   OR p.predicted_from <> p.embedding_hash)
+            RETURN p.paper_id AS id, p.embedding_hash AS embedding_hash
+        """,
+            score_all=score_all,
+        )
+        return [(r["id"], r["embedding_hash"]) for r in result]
+
+
+def fetch_in_neighbours(paper_ids, edge_types, fanout=FANOUT):
+    """
+    Up to `fanout` embedded papers with an edge into each paper, with their years.
+    """
+    with driver.session() as session, metrics.neo4j_query("in_neighbours"):
+        result = session.run(
+            """
+            UNWIND $ids AS id
+            MATCH (p:Paper {paper_id: id})
+            RETURN p.paper_id AS target, p.year AS target_year,
+                   [(n:Paper)-[r]->(p)
+                    WHERE type(r) IN $edge_types
+                      AND n.embedding IS NOT NULL AND n.year IS NOT NULL
+                    | [n.paper_id, n.year]][..$fanout] AS neighbours
+        """,
+            ids=paper_ids,
+            edge_types=edge_types,
+            fanout=fanout,
+        )
+        return [(r["target"], r["target_year"], r["neighbours"]) for r in result]
+
+
+def build_subgraph(predictor, paper_ids):
+    """
+    Local 2-hop subgraph around `paper_ids`: the features of all its nodes, its
+    edge_index and the rows of the papers to score.
+    """
+    index, years, edges = {}, [], set()
+
+    def node(paper_id, year):
+        if paper_id not in index:
+            index[paper_id] = len(index)
+            years.append(year)
+        return index[paper_id]
+
+    frontier = paper_ids
+    for _ in range(2):
+        next_frontier = []
+        for target, target_year, neighbours in fetch_in_neighbours(
+            frontier, predictor.edge_types
+        ):
+            t = node(target, target_year)
+            for paper_id, year in neighbours:
+                if paper_id not in index:
+                    next_frontier.append(paper_id)
+                edges.add((node(paper_id, year), t))
+        frontier = next_frontier
+
+    # Papers missing from the embedding store can't be featurized
+    ids = list(index)
+    keep = predictor.store.rows(ids) >= 0
+    new_row = torch.full((len(ids),), -1, dtype=torch.long)
+    new_row[torch.from_numpy(keep)] = torch.arange(int(keep.sum()))
+    ids = [paper_id for paper_id, k in zip(ids, keep) if k]
+    years = [year for year, k in zip(years, keep) if k]
+
+    edge_index = new_row[torch.tensor(sorted(edges), dtype=torch.long).view(-1, 2).t()]
+    edge_index = edge_index[:, (edge_index >= 0).all(dim=0)]
+    targets = new_row[[index[p] for p in paper_ids if p in index]]
+    return predictor.features(ids, years), edge_index, targets[targets >= 0], ids
+
+
+def write_predictions(rows):
+    with driver.session() as session:
+        for i in range(0, len(rows), WRITE_BATCH_SIZE):
+            metrics.execute_write(
+                session,
+                lambda tx, chunk: tx.run(
+                    """
+                    UNWIND $rows AS row
+                    MATCH (p:Paper {paper_id: row.id})
+                    SET p.predicted_citations = row.predicted_citations,
+                        p.predicted_from = row.embedding_hash
+                    """,
+                    rows=chunk,
+                ),
+                rows[i : i + WRITE_BATCH_SIZE],
+                query="predictions",
+            )
+
+
+def main(score_all=False):
+    print("Loading model...")
+    predictor = CitationPredictor()
+
+    print("Finding papers to score...")
+    papers = fetch_papers_to_score(score_all)
+    print(f"Found {len(papers)} papers without an up-to-date prediction.")
+
+    start = time.perf_counter()
+    scored = 0
+    for i in tqdm(range(0, len(papers), BATCH_SIZE), desc="Scoring"):
+        batch = papers[i : i + BATCH_SIZE]
+        x, edge_index, targets, ids = build_subgraph(predictor, [p for p, _ in batch])
+        predictions = predictor.predict(x, edge_index, targets)
+
+        hash_of = dict(batch)
+        rows = [
+            {
+                "id": ids[row],
+                "predicted_citations": float(value),
+                "embedding_hash": hash_of[ids[row]],
+            }
+            for row, value in zip(targets.tolist(), predictions.tolist())
+        ]
+        write_predictions(rows)
+        scored += len(rows)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scored {scored} papers in {elapsed:.1f}s "
+        f"({scored / max(elapsed, 1e-9):.0f} papers/s)."
+    )
+
+
+if __name__ == "__main__":
+    # Pass --all to re-score every paper instead of only new or updated ones
+    main(score_all="--all" in sys.argv)
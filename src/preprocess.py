@@ -2,6 +2,7 @@ import requests
 import json
 import time
 import datetime
+from src import metrics
 from src.openalex import format_paper
 
 
@@ -19,8 +20,13 @@ class PaperRetriever:
     REQUEST_COUNT = 0  # Track requests
     FIRST_REQUEST_TIME = None  # Timestamp of the first request
 
-    def __init__(self):
-        """Initializes the PaperRetriever."""
+    def __init__(self, openalex_url=None):
+        """
+        Initializes the PaperRetriever. `openalex_url` replaces the OpenAlex /works
+        endpoint, e.g. with the local stand-in of openalex_stub.py.
+        """
+        if openalex_url:
+            self.OPENALEX_URL = openalex_url
         self.data = {
             "works": [],
             "authors": [],
@@ -60,9 +66,33 @@ class PaperRetriever:
 
         if self.REQUEST_COUNT % 1000 == 0:
             print(f"📊 {self.REQUEST_COUNT} requests sent so far.")
+            metrics.event(
+                "crawler_progress",
+                requests=self.REQUEST_COUNT,
+                works=len(self.data["works"]),
+                authors=len(self.data["authors"]),
+            )
 
         # time.sleep(self.SLEEP_TIME)  # Control rate
 
+    def _get(self, url, endpoint, params=None):
+        """requests.get, with its latency and status recorded under `endpoint`."""
+        start = time.perf_counter()
+        try:
+            response = requests.get(url, params=params)
+        except requests.RequestException as e:
+            metrics.inc(
+                "http_requests_total", endpoint=endpoint, status=type(e).__name__
+            )
+            raise
+        metrics.observe(
+            "http_request_seconds", time.perf_counter() - start, endpoint=endpoint
+        )
+        metrics.inc(
+            "http_requests_total", endpoint=endpoint, status=response.status_code
+        )
+        return response
+
     def fetch_papers(self):
         """Fetches all papers using cursor-based pagination."""
         cursor = "*"
@@ -74,7 +104,7 @@ class PaperRetriever:
                 "filter": self.FILTER_QUERY,
                 "per_page": self.PER_PAGE,
             }
-            response = requests.get(self.OPENALEX_URL, params=params)
+            response = self._get(self.OPENALEX_URL, "works_page", params=params)
             self._rate_limit()  # Ensure compliance
 
             if response.status_code == 200:
@@ -101,7 +131,7 @@ class PaperRetriever:
 
     def _get_citations_openalex(self, paper):
         if paper.get("cited_by_api_url", None):
-            response = requests.get(paper.get("cited_by_api_url", None))
+            response = self._get(paper.get("cited_by_api_url", None), "cited_by")
             if response.status_code == 200:
                 data = response.json()
                 return data.get("results", [])
@@ -144,8 +174,8 @@ class PaperRetriever:
 
         # Process related work
         for referenced_paper in paper.get("related_works", []):
-            response = requests.get(
-                f"{self.OPENALEX_URL}/{referenced_paper.split('/')[-1]}"
+            response = self._get(
+                f"{self.OPENALEX_URL}/{referenced_paper.split('/')[-1]}", "work"
             )
             self._rate_limit()  # Ensure compliance
             if response.status_code == 200:
@@ -174,11 +204,11 @@ class PaperRetriever:
 
     def run(self, output_file="ai_research_papers.json"):
         """Runs the full pipeline: fetching and saving papers."""
-        self.fetch_papers()
+        with metrics.span("harvest"):
+            self.fetch_papers()
         self.save_to_json(filename=output_file)
 
 
 if __name__ == "__main__":
     graph = PaperRetriever()
-    graph.fetch_papers()
-    graph.save_to_json()
+    graph.run(output_file="data/openalex_research_papers.json")
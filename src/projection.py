@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import hashlib
+from src import metrics
+
+
+"""
+Shared manager of the GDS in-memory projections used by similarities.py and clusters.py.
+
+A projection is kept alive in the GDS catalog between runs and reused as long as the
+fingerprint of the graph it was built from is unchanged. Whole-graph projections are
+native when every Paper node has an embedding; subsets by year or topic, or graphs
+with papers still missing their embedding, use a Cypher projection.
+"""
+
+# ---------- CONFIG ---------- #
+GRAPH_NAME = "paper_graph"
+STATE_PATH = "data/projections.json"  # fingerprint and timings of each projection
+PAPER_RELATIONSHIPS = ["CITES", "RELATED", "SIMILAR_TO"]
+# ---------------------------- #
+
+
+def embedding_checksum(var="p"):
+    """
+    Cypher aggregate over the embeddings of the `var` nodes. Each node adds its id
+    combined with the first components of its vector, so re-embedding any paper (from
+    another abstract or with another model) changes the sum, even when every count
+    stays the same. Nodes without an embedding add nothing.
+    """
+    scaled = [f"toInteger({var}.embedding[{i}] * 1000000)" for i in (0, 1)]
+    return f"sum(((id({var}) % 1000003 + 1) * {scaled[0]} + {scaled[1]}) % 1000000007)"
+
+
+def relationship_checksum(source="p1", target="p2", rel="r"):
+    """
+    Cypher aggregate over the endpoints and `score` of the `rel` relationships, so
+    rewiring an edge changes it even when the number of edges does not.
+    """
+    score = f"toInteger(coalesce({rel}.score, 0.0) * 1000000)"
+    return f"sum((id({source}) * 1000003 + id({target}) + {score}) % 1000000007)"
+
+
+def _subset_filter(years, topics, var="p"):
+    conditions = []
+    if years is not None:
+        conditions.append(f"{var}.year >= $min_year AND {var}.year <= $max_year")
+    if topics is not None:
+        conditions.append(
+            f"EXISTS {{ ({var})-[:HAS_TOPIC]->(t:Topic) WHERE t.name IN $topics }}"
+        )
+    return " AND ".join(conditions)
+
+
+def _subset_parameters(years, topics):
+    parameters = {}
+    if years is not None:
+        parameters["min_year"], parameters["max_year"] = years
+    if topics is not None:
+        parameters["topics"] = sorted(topics)
+    return parameters
+
+
+class ProjectionManager:
+    """
+    Projects Paper nodes (with their `embedding`) and the Paper-Paper relationships,
+    optionally restricted to `years` (an inclusive (min, max) pair) and/or `topics`.
+    """
+
+    def __init__(self, gds, state_path=STATE_PATH):
+        self.gds = gds
+        self.state_path = state_path
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4)
+
+    def graph_name(self, years=None, topics=None):
+        """Subsets get their own name, so they can live next to the full projection."""
+        if years is None and topics is None:
+            return GRAPH_NAME
+        key = json.dumps(_subset_parameters(years, topics), sort_keys=True)
+        return f"{GRAPH_NAME}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}"
+
+    def graph_state(self, years=None, topics=None):
+        """
+        Counts and content checksums of the part of the graph that would be projected.
+        Counts alone miss re-embedded abstracts (one hash replaces another) and
+        rewired SIMILAR_TO edges (every paper keeps k of them), so the embeddings
+        and each relationship type are also checksummed.
+        """
+        where = _subset_filter(years, topics)
+        where = f"AND {where}" if where else ""
+        # Only the relationships between papers of the subset are projected
+        relationship_where = " ".join(
+            f"AND {condition}"
+            for condition in (
+                _subset_filter(years, topics, "p1"),
+                _subset_filter(years, topics, "p2"),
+            )
+            if condition
+        )
+        with metrics.neo4j_query("projection_state"):
+            row = self.gds.run_cypher(
+                f"""
+                MATCH (p:Paper)
+                WHERE true {where}
+                WITH count(p) AS papers,
+                     count(p.embedding) AS embedded,
+                     collect(DISTINCT p.embedding_model) AS models,
+                     {embedding_checksum("p")} AS embeddings
+                CALL {{
+                    MATCH (p1:Paper)-[r]->(p2:Paper)
+                    WHERE type(r) IN $relationship_types {relationship_where}
+                    WITH type(r) AS type, count(r) AS count,
+                         {relationship_checksum("p1", "p2", "r")} AS checksum
+                    RETURN collect([type, count, checksum]) AS relationships
+                }}
+                RETURN papers, embedded, models, embeddings, relationships
+                """,
+                {
+                    **_subset_parameters(years, topics),
+                    "relationship_types": PAPER_RELATIONSHIPS,
+                },
+            ).iloc[0]
+        return {
+            "papers": int(row["papers"]),
+            "embedded": int(row["embedded"]),
+            "models": sorted(row["models"]),
+            "embeddings": int(row["embeddings"] or 0),
+            "relationships": {
+                t: [int(c), int(checksum)]
+                for t, c, checksum in sorted(row["relationships"])
+            },
+            "subset": _subset_parameters(years, topics),
+        }
+
+    @staticmethod
+    def fingerprint(graph_state):
+        key = json.dumps(graph_state, sort_keys=True)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _is_native(self, graph_state):
+        return (
+            not graph_state["subset"]
+            and graph_state["embedded"] == graph_state["papers"]
+        )
+
+    def _cypher_queries(self, years, topics):
+        def node_filter(var):
+            where = _subset_filter(years, topics, var)
+            return f"{var}.embedding IS NOT NULL" + (f" AND {where}" if where else "")
+
+        node_query = f"""
+            MATCH (p:Paper)
+            WHERE {node_filter("p")}
+            RETURN id(p) AS id, labels(p) AS labels, p.embedding AS embedding
+        """
+        relationship_query = f"""
+            MATCH (p1:Paper)-[r]->(p2:Paper)
+            WHERE type(r) IN $relationship_types
+              AND {node_filter("p1")}
+              AND {node_filter("p2")}
+            RETURN id(p1) AS source, id(p2) AS target, type(r) AS type
+        """
+        parameters = {
+            **_subset_parameters(years, topics),
+            "relationship_types": PAPER_RELATIONSHIPS,
+        }
+        return node_query, relationship_query, parameters
+
+    def estimate(self, years=None, topics=None, graph_state=None):
+        """
+        Memory GDS expects the projection to need, and the projection time extrapolated
+        from earlier projections of this manager (None if it never projected).
+        """
+        graph_state = graph_state or self.graph_state(years, topics)
+        with metrics.neo4j_query("projection_estimate", mode="gds"):
+            if self._is_native(graph_state):
+                row = self.gds.run_cypher(
+                    """
+                    CALL gds.graph.project.estimate({Paper: {properties: 'embedding'}}, $relationship_types)
+                    YIELD requiredMemory, bytesMax
+                    RETURN requiredMemory, bytesMax
+                    """,
+                    {"relationship_types": PAPER_RELATIONSHIPS},
+                ).iloc[0]
+            else:
+                node_query, relationship_query, parameters = self._cypher_queries(
+                    years, topics
+                )
+                row = self.gds.run_cypher(
+                    """
+                    CALL gds.graph.project.cypher.estimate($node_query, $relationship_query, {parameters: $parameters})
+                    YIELD requiredMemory, bytesMax
+                    RETURN requiredMemory, bytesMax
+                    """,
+                    {
+                        "node_query": node_query,
+                        "relationship_query": relationship_query,
+                        "parameters": parameters,
+                    },
+                ).iloc[0]
+
+        estimated_seconds = None
+        history = [s for s in self._load_state().values() if s.get("papers")]
+        if history:
+            seconds_per_paper = sum(s["seconds"] for s in history) / sum(
+                s["papers"] for s in history
+            )
+            estimated_seconds = seconds_per_paper * graph_state["embedded"]
+
+        return {
+            "native": self._is_native(graph_state),
+            "papers": graph_state["embedded"],
+            "required_memory": row["requiredMemory"],
+            "bytes_max": int(row["bytesMax"]),
+            "estimated_seconds": estimated_seconds,
+        }
+
+    def get(self, years=None, topics=None):
+        """
+        Returns the projection of the requested (sub)graph, reusing the one in the GDS
+        catalog when the graph has not changed since it was projected.
+        """
+        name = self.graph_name(years, topics)
+        graph_state = self.graph_state(years, topics)
+        fingerprint = self.fingerprint(graph_state)
+        state = self._load_state()
+
+        if self.gds.graph.exists(name)["exists"]:
+            if state.get(name, {}).get("fingerprint") == fingerprint:
+                print(f"Reusing projection '{name}' (graph unchanged).")
+                return self.gds.graph.get(name)
+            self.drop(name)
+
+        estimate = self.estimate(years, topics, graph_state)
+        eta = ""
+        if estimate["estimated_seconds"] is not None:
+            eta = f", ~{estimate['estimated_seconds']:.0f}s"
+        print(
+            f"Projecting '{name}' ({'native' if estimate['native'] else 'Cypher'}): "
+            f"{estimate['papers']} papers, estimated {estimate['required_memory']}{eta}"
+        )
+
+        start = time.perf_counter()
+        with metrics.neo4j_query("projection", mode="gds"):
+            if estimate["native"]:
+                graph, _ = self.gds.graph.project(
+                    name,
+                    {"Paper": {"properties": ["embedding"]}},
+                    {
+                        rel_type: {"orientation": "NATURAL"}
+                        for rel_type in PAPER_RELATIONSHIPS
+                    },
+                )
+            else:
+                node_query, relationship_query, parameters = self._cypher_queries(
+                    years, topics
+                )
+                graph, _ = self.gds.graph.project.cypher(
+                    name, node_query, relationship_query, parameters=parameters
+                )
+        seconds = time.perf_counter() - start
+
+        state[name] = {
+            "fingerprint": fingerprint,
+            "papers": graph.node_count(),
+            "seconds": seconds,
+            "projected_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self._save_state(state)
+        print(
+            f"projected graph: {graph.node_count()} nodes, {graph.relationship_count()} edges "
+            f"in {seconds:.1f}s"
+        )
+        return graph
+
+    def drop(self, name=GRAPH_NAME):
+        """Drops the projection if it exists."""
+        if self.gds.graph.exists(name)["exists"]:
+            self.gds.graph.drop(self.gds.graph.get(name))
+            print(f"Named graph '{name}' deleted successfully.")
+        state = self._load_state()
+        if state.pop(name, None) is not None:
+            self._save_state(state)
+
+
+if __name__ == "__main__":
+    import sys
+    from neo4j import GraphDatabase
+    from graphdatascience import GraphDataScience
+
+    URI = "bolt://localhost:7687"
+    AUTH = ("neo4j", "trendgraph")
+
+    projections = ProjectionManager(
+        GraphDataScience(GraphDatabase.driver(URI, auth=AUTH))
+    )
+    if "--drop" in sys.argv:
+        # Free the GDS memory held by every projection of this manager
+        for name in list(projections._load_state()):
+            projections.drop(name)
+    else:
+        print(projections.estimate())
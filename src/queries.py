@@ -1,6 +1,7 @@
 import os
 import csv
 from neo4j import GraphDatabase, Session
+from src import metrics
 
 
 def save_to_csv(filename, data):
@@ -141,31 +142,47 @@ if __name__ == "__main__":
     # Build the knowledge graph
     with GraphDatabase.driver(URI, auth=AUTH).session() as session:
         # Get the most popular topics
-        result = session.execute_read(most_popular_topics)
+        result = metrics.execute_read(
+            session, most_popular_topics, query="most_popular_topics"
+        )
         save_to_csv(os.path.join(output_dir, "most_popular_topics.csv"), result)
 
         # Get the emerging topics
-        result = session.execute_read(get_emerging_topics)
+        result = metrics.execute_read(
+            session, get_emerging_topics, query="get_emerging_topics"
+        )
         save_to_csv(os.path.join(output_dir, "emerging_topics.csv"), result)
 
         # Get the most influential topics
-        result = session.execute_read(most_influential_topics)
+        result = metrics.execute_read(
+            session, most_influential_topics, query="most_influential_topics"
+        )
         save_to_csv(os.path.join(output_dir, "most_influential_topics.csv"), result)
 
         # Get the most influential authors by topic
-        result = session.execute_read(most_influential_authors_by_topic)
+        result = metrics.execute_read(
+            session,
+            most_influential_authors_by_topic,
+            query="most_influential_authors_by_topic",
+        )
         save_to_csv(
             os.path.join(output_dir, "most_influential_authors_by_topic.csv"), result
         )
 
         # Get the top authors involved in similar papers
-        result = session.execute_read(top_authors_involved_in_similar_papers)
+        result = metrics.execute_read(
+            session,
+            top_authors_involved_in_similar_papers,
+            query="top_authors_involved_in_similar_papers",
+        )
         save_to_csv(
             os.path.join(output_dir, "top_authors_involved_in_similar_papers.csv"),
             result,
         )
 
         # Link similar authors
-        session.execute_write(link_similar_authors)
+        metrics.execute_write(
+            session, link_similar_authors, query="link_similar_authors"
+        )
 
         print("Results saved to CSV files.")
@@ -1,92 +1,316 @@
+import os
 import csv
+import sys
+import json
+import time
+import queue
+import hashlib
+import threading
+import numpy as np
 from tqdm import tqdm
 from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
 from graphdatascience import GraphDataScience
+from src import metrics
+from src.build_graph import create_constraints
+from src.knn import build_similarity_edges, update_similarity_edges
+from src.projection import ProjectionManager
+from src.embedding import EncoderPool, load_model, encode_texts
+from src.embedding_store import EmbeddingStore, fetch_embedding_pages
 
 
 """
 In this script we want to:
 
-1. 🔄 Extract abstract fields from Paper nodes
+1. 🔄 Extract abstract fields from Paper nodes page by page (only new or changed ones by default)
 2. 🧠 Embed them using sentence-transformers
-3. 💾 Save embeddings into Neo4j
-4. 🧠 Trigger Neo4j GDS to compute pairwise cosine similarities
+3. 💾 Save embeddings into Neo4j and the shared on-disk embedding store
+
+Steps 1-3 run as a streaming pipeline: pages are read, encoded and written concurrently
+through bounded queues, and an interrupted run resumes after the last written page.
+4. 🧠 Compute the top-k cosine similarities in-process (or with Neo4j GDS) and store them as SIMILAR_TO
+   (incremental runs only recompute the neighbours of the newly embedded papers)
 """
 
 # ---------- CONFIG ---------- #
 URI = "bolt://localhost:7687"
 AUTH = ("neo4j", "trendgraph")  # adjust your password
 MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DTYPE = "float32"  # or "float16" to halve the on-disk store
+EMBED_BACKEND = "torch"  # or "torch-int8", "onnx", "onnx-int8" (see embedding.py)
+EMBED_PROCESSES = 1  # > 1 encodes on a pool of worker processes
+WRITE_BATCH_SIZE = 1000  # papers per write transaction
+PAGE_SIZE = 5000  # abstracts read per query, and encoded/written together
+QUEUE_SIZE = 2  # pages buffered between the read, encode and write stages
+CHECKPOINT_PATH = "data/embedding_checkpoint.json"
 # ---------------------------- #
 
 driver = GraphDatabase.driver(URI, auth=AUTH)
-model = SentenceTransformer(MODEL_NAME)
-gds = GraphDataScience(driver)
+model = load_model(MODEL_NAME, EMBED_BACKEND)
 
 
-def get_paper_abstracts():
-    with driver.session() as session:
+def abstract_hash(abstract):
+    return hashlib.sha1(abstract.encode("utf-8")).hexdigest()
+
+
+def is_stale(paper):
+    """
+    A stored embedding is stale when it is missing, was computed by another model
+    or was computed from a different abstract.
+    """
+    return (
+        not paper["has_embedding"]
+        or paper["embedding_model"] != MODEL_NAME
+        or paper["embedding_hash"] != abstract_hash(paper["abstract"])
+    )
+
+
+def get_paper_abstracts(incremental=True, after_id="", limit=PAGE_SIZE):
+    """
+    Returns a page of up to `limit` papers with an abstract, ordered by paper_id and
+    starting after `after_id`, together with the last paper_id read (None once there
+    are no papers left). In incremental mode only the papers whose embedding is
+    missing or stale are kept.
+    """
+    with driver.session() as session, metrics.neo4j_query("abstracts_page"):
         result = session.run(
             """
             MATCH (p:Paper)
-            WHERE p.abstract IS NOT NULL
-            RETURN p.paper_id AS id, p.abstract AS abstract
-        """
+            WHERE p.abstract IS NOT NULL AND p.paper_id > $after_id
+            RETURN p.paper_id AS id, p.abstract AS abstract,
+                   p.embedding IS NOT NULL AS has_embedding,
+                   p.embedding_hash AS embedding_hash,
+                   p.embedding_model AS embedding_model
+            ORDER BY p.paper_id
+            LIMIT $limit
+        """,
+            after_id=after_id,
+            limit=limit,
         )
-        return [{"id": r["id"], "abstract": r["abstract"]} for r in result]
+        papers = [dict(r) for r in result]
+
+    last_id = papers[-1]["id"] if papers else None
+    if incremental:
+        papers = [p for p in papers if is_stale(p)]
+    return [{"id": p["id"], "abstract": p["abstract"]} for p in papers], last_id
+
+
+def _write_embedding_batch(tx, rows):
+    # setNodeVectorProperty stores the vector as a float32 array instead of a list of doubles
+    tx.run(
+        """
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.id})
+        CALL db.create.setNodeVectorProperty(p, 'embedding', row.embedding)
+        SET p.embedding_hash = row.embedding_hash,
+            p.embedding_model = $embedding_model
+        """,
+        rows=rows,
+        embedding_model=MODEL_NAME,
+    )
 
 
-def store_embeddings(papers):
+def store_embeddings(papers, batch_size=WRITE_BATCH_SIZE):
+    """
+    Writes the embeddings back to Neo4j in chunks of `batch_size` papers, one explicit
+    transaction per chunk.
+    """
+    start = time.perf_counter()
     with driver.session() as session:
-        for paper in tqdm(papers, desc="Storing embeddings"):
-            session.run(
-                f"""
-                MATCH (p:Paper {{paper_id: $id}})
-                SET p.embedding = $embedding
-            """,
-                {"id": paper["id"], "embedding": paper["embedding"]},
+        for i in tqdm(range(0, len(papers), batch_size), desc="Storing embeddings"):
+            rows = [
+                {
+                    "id": paper["id"],
+                    "embedding": paper["embedding"],
+                    "embedding_hash": paper["embedding_hash"],
+                }
+                for paper in papers[i : i + batch_size]
+            ]
+            metrics.execute_write(
+                session, _write_embedding_batch, rows, query="embeddings"
             )
 
+    elapsed = time.perf_counter() - start
+    print(
+        f"Stored {len(papers)} embeddings in {elapsed:.1f}s "
+        f"({len(papers) / max(elapsed, 1e-9):.0f} papers/s)."
+    )
+
 
-def embed_papers(papers):
+def update_embedding_store(store):
+    """
+    Merges the embeddings staged by the pipeline into the on-disk store of MODEL_NAME
+    and makes it the current store. The first time, the embeddings of this model
+    already in Neo4j are staged as well, page by page, so the new store holds every
+    embedded paper without the whole matrix being read into memory.
+    """
+    if not store.exists():
+        staged = set(store.pending_ids())
+        for ids, embeddings in fetch_embedding_pages(driver, model_name=MODEL_NAME):
+            keep = [i for i, paper_id in enumerate(ids) if paper_id not in staged]
+            if keep:
+                store.stage([ids[i] for i in keep], embeddings[keep])
+    if store.has_pending():
+        store.merge_pending()
+    if store.exists():
+        store.make_current()
+    return store
+
+
+def embed_papers(papers, pool=None):
     texts = [p["abstract"] for p in papers]
-    embeddings = model.encode(texts, show_progress_bar=True, normalize_embeddings=True)
+    start = time.perf_counter()
+    embeddings = encode_texts(
+        texts,
+        model=model,
+        model_name=MODEL_NAME,
+        backend=EMBED_BACKEND,
+        processes=EMBED_PROCESSES,
+        pool=pool,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"Encoded {len(texts)} abstracts in {elapsed:.1f}s "
+        f"({len(texts) / max(elapsed, 1e-9):.0f} abstracts/s)."
+    )
     for i, emb in enumerate(embeddings):
         papers[i]["embedding"] = emb.tolist()
+        papers[i]["embedding_hash"] = abstract_hash(papers[i]["abstract"])
     return papers
 
 
-def create_named_graph():
-    """
-    Project the graph into a named graph for GDS algorithms with all the Paper nodes (embedding property).
-    """
+def _load_checkpoint(incremental):
+    if not os.path.exists(CHECKPOINT_PATH):
+        return ""
+    with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if (
+        checkpoint["model_name"] != MODEL_NAME
+        or checkpoint["incremental"] != incremental
+    ):
+        return ""
+    print(f"Resuming after paper {checkpoint['last_id']}.")
+    return checkpoint["last_id"]
+
+
+def _save_checkpoint(last_id, incremental):
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    with open(CHECKPOINT_PATH, "w", encoding="utf-8") as f:
+        json.dump(
+            {"model_name": MODEL_NAME, "incremental": incremental, "last_id": last_id},
+            f,
+        )
 
-    gds.graph.project.cypher(
-        "paper_graph",
-        """
-        MATCH (p:Paper)
-        WHERE p.embedding IS NOT NULL
-        RETURN id(p) AS id, labels(p) AS labels, p.embedding AS embedding
-        """,
-        """
-        MATCH (p1:Paper)-[r]->(p2:Paper)
-        WHERE p1.embedding IS NOT NULL AND p2.embedding IS NOT NULL
-        RETURN id(p1) AS source, id(p2) AS target, type(r) AS type
-        """,
-    )
-    paper_graph = gds.graph.get("paper_graph")
-    print(
-        f"projected graph: {paper_graph.node_count()} nodes, {paper_graph.relationship_count()} edges"
-    )
-    print("Named graph 'paper_graph' created successfully.")
 
+_DONE = object()  # Sent downstream by a stage once it has no more pages
 
-def run_gds_node_similarity():
-    with driver.session() as session:
+
+def _put(q, item, stop):
+    """Blocks while `q` is full (backpressure), giving up if another stage failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def stream_embeddings(store, incremental=True, page_size=PAGE_SIZE):
+    """
+    Reads, encodes and writes the abstracts page by page, with a reader thread, the
+    encoder on the calling thread and a writer thread connected by queues of
+    QUEUE_SIZE pages. At most ~2 * QUEUE_SIZE + 3 pages are in memory at once.
+
+    After each written page its last paper_id is checkpointed and its embeddings are
+    staged in the store, so a failed run resumes where it stopped. With
+    EMBED_PROCESSES > 1 every page is encoded by the same pool of worker processes.
+    Returns the number of papers embedded.
+    """
+    to_encode = queue.Queue(maxsize=QUEUE_SIZE)
+    to_write = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+    written = [0]
+
+    def read():
+        try:
+            after_id = _load_checkpoint(incremental)
+            while True:
+                papers, last_id = get_paper_abstracts(incremental, after_id, page_size)
+                if last_id is None:
+                    break
+                if not _put(to_encode, (papers, last_id), stop):
+                    return
+                after_id = last_id
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(to_encode, _DONE, stop)
+
+    def write():
+        try:
+            while (item := _get(to_write, stop)) is not _DONE:
+                papers, last_id = item
+                if papers:
+                    store_embeddings(papers)
+                    store.stage(
+                        [p["id"] for p in papers],
+                        np.asarray([p["embedding"] for p in papers], dtype=np.float32),
+                    )
+                    written[0] += len(papers)
+                _save_checkpoint(last_id, incremental)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    reader = threading.Thread(target=read, daemon=True)
+    writer = threading.Thread(target=write, daemon=True)
+    reader.start()
+    writer.start()
+    pool = None
+
+    try:
+        if EMBED_PROCESSES > 1:
+            pool = EncoderPool(MODEL_NAME, EMBED_BACKEND, EMBED_PROCESSES)
+        while (item := _get(to_encode, stop)) is not _DONE:
+            papers, last_id = item
+            if papers:
+                papers = embed_papers(papers, pool)
+            if not _put(to_write, (papers, last_id), stop):
+                break
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        _put(to_write, _DONE, stop)
+        reader.join()
+        writer.join()
+        if pool is not None:
+            pool.close()
+
+    if errors:
+        raise errors[0]
+
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)  # Finished: the next run starts from the beginning
+    return written[0]
+
+
+def run_gds_node_similarity(graph_name):
+    with driver.session() as session, metrics.neo4j_query("gds_knn", mode="gds"):
         result = session.run(
             """
-                CALL gds.knn.write('paper_graph', {
+                CALL gds.knn.write($graph_name, {
                 nodeLabels: ['Paper'],
                 nodeProperties: {embedding: 'COSINE'},
                 writeRelationshipType: 'SIMILAR_TO',
@@ -94,7 +318,8 @@ def run_gds_node_similarity():
                 topK: 10
                 })
                 YIELD nodesCompared, relationshipsWritten
-            """
+            """,
+            graph_name=graph_name,
         )
         stats = result.single()
         print(
@@ -107,7 +332,7 @@ def export_similar_to_csv(output_path):
         MATCH (p1:Paper)-[r:SIMILAR_TO]->(p2:Paper)
         RETURN p1.title AS source_title, p2.title AS target_title, r.score AS similarity
     """
-    with driver.session() as session:
+    with driver.session() as session, metrics.neo4j_query("export_similar_to"):
         results = session.run(query)
         rows = [
             (r["source_title"], r["target_title"], r["similarity"]) for r in results
@@ -121,46 +346,54 @@ def export_similar_to_csv(output_path):
     print(f"Exported {len(rows)} rows to {output_path}")
 
 
-def delete_named_graph():
+def main(incremental=True, use_gds=False, approximate=False):
+    # Graphs built before build_graph created the constraints get them here, ahead
+    # of the first batched write
     with driver.session() as session:
-        session.run(
-            """
-            CALL gds.graph.drop('paper_graph')
-            YIELD graphName
-            RETURN graphName
-            """
-        )
-        print("Named graph 'paper_graph' deleted successfully.")
+        create_constraints(session)
 
+    print("Embedding abstracts...")
+    store = EmbeddingStore(MODEL_NAME, dtype=EMBEDDING_DTYPE)
+    start = time.perf_counter()
+    n_embedded = stream_embeddings(store, incremental=incremental)
+    print(f"Embedded {n_embedded} papers in {time.perf_counter() - start:.1f}s.")
 
-def main():
-    print("Fetching abstracts...")
-    papers = get_paper_abstracts()
-    print(f"Found {len(papers)} papers without embeddings.")
+    print("Updating the embedding store...")
+    embedded_ids = store.pending_ids()
+    update_embedding_store(store)
 
-    if not papers:
+    if not n_embedded:
         print("No papers to embed. Exiting.")
         return
 
-    print("Generating embeddings...")
-    papers = embed_papers(papers)
-
-    print("Saving embeddings to Neo4j...")
-    store_embeddings(papers)
-
-    print("Creating named graph...")
-    create_named_graph()
-
-    print("Running GDS node similarity...")
-    run_gds_node_similarity()
+    if use_gds:
+        print("Getting named graph...")
+        # Only built here: the client checks the GDS version on construction, which
+        # fails on servers without the plugin
+        paper_graph = ProjectionManager(GraphDataScience(driver)).get()
+
+        print("Running GDS node similarity...")
+        run_gds_node_similarity(paper_graph.name())
+    else:
+        print("Computing KNN similarities...")
+        if incremental:
+            update_similarity_edges(
+                driver, store, embedded_ids, approximate=approximate
+            )
+        else:
+            build_similarity_edges(driver, store, approximate=approximate)
 
     print("Exporting similar papers to CSV...")
     export_similar_to_csv("output/similar_papers.csv")
-
-    print("Deleting named graph...")
-    delete_named_graph()
     print("Done!")
 
 
 if __name__ == "__main__":
-    main()
+    # Pass --full to re-encode every abstract regardless of the stored hashes
+    # and --gds to compute the similarities with gds.knn instead of in-process
+    # (--approximate uses an HNSW index instead of the exact in-process search)
+    main(
+        incremental="--full" not in sys.argv,
+        use_gds="--gds" in sys.argv,
+        approximate="--approximate" in sys.argv,
+    )
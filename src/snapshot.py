@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import torch
+from src import metrics
+from src.projection import embedding_checksum, relationship_checksum
+
+
+"""
+Versioned tensor snapshot of the citation graph used to train the GCN:
+
+1. 📥 Fetch the training papers and Paper-Paper edges as integer node ids
+2. 🧮 Build features (embedding + year), targets and edge_index with vectorized NumPy
+3. 💾 Save them with the normalization stats as data/snapshots/graph_<version>.pt
+
+Edges are also kept per relationship type, so a subset of the edge types can be
+selected without fetching the graph again.
+
+The version hashes content checksums of the papers, their embeddings and each edge
+type, and the revision of the embedding store, so a snapshot is rebuilt when an
+abstract is re-embedded or edges are rewired, even if no count changes.
+"""
+
+# ---------- CONFIG ---------- #
+SNAPSHOT_DIR = "data/snapshots"
+EDGE_TYPES = ["CITES", "RELATED", "SIMILAR_TO"]
+FORMAT = 2  # bumped when the snapshot layout changes, so older snapshots are rebuilt
+MIN_YEAR = 2008
+MAX_YEAR = 2022
+# ---------------------------- #
+
+PAPER_FILTER = """
+    p.embedding IS NOT NULL AND p.citations IS NOT NULL AND p.citations > 0
+    AND p.year >= $min_year AND p.year <= $max_year
+"""
+
+
+def graph_version(driver, store, edge_types=EDGE_TYPES):
+    """
+    Hash of the counts and checksums of the training papers (citations and embeddings)
+    and of each edge type, and of the embedding store the features are read from.
+    """
+    with driver.session() as session, metrics.neo4j_query("graph_version"):
+        row = session.run(
+            f"""
+            MATCH (p:Paper)
+            WHERE {PAPER_FILTER}
+            WITH count(p) AS papers,
+                 sum((id(p) % 1000003 + 1) * p.citations % 1000000007) AS citations,
+                 collect(DISTINCT p.embedding_model) AS models,
+                 {embedding_checksum("p")} AS embeddings
+            CALL {{
+                MATCH (p1:Paper)-[r]->(p2:Paper)
+                WHERE type(r) IN $edge_types
+                WITH type(r) AS type, count(r) AS count,
+                     {relationship_checksum("p1", "p2", "r")} AS checksum
+                RETURN collect([type, count, checksum]) AS edges
+            }}
+            RETURN papers, citations, models, embeddings, edges
+        """,
+            min_year=MIN_YEAR,
+            max_year=MAX_YEAR,
+            edge_types=edge_types,
+        ).single()
+
+    state = {
+        **row.data(),
+        "models": sorted(row["models"]),
+        "edges": sorted(row["edges"]),
+        "edge_types": sorted(edge_types),
+        "years": [MIN_YEAR, MAX_YEAR],
+        "store": [store.model_name, len(store), store.revision],
+        "format": FORMAT,
+    }
+    key = json.dumps(state, sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def fetch_papers(driver):
+    """
+    Returns the internal node ids, paper ids, years and citations of the training papers.
+    """
+    with driver.session() as session, metrics.neo4j_query("snapshot_papers"):
+        result = session.run(
+            f"""
+            MATCH (p:Paper)
+            WHERE {PAPER_FILTER}
+            RETURN id(p) AS node_id, p.paper_id AS id, p.year AS year, p.citations AS citations
+        """,
+            min_year=MIN_YEAR,
+            max_year=MAX_YEAR,
+        )
+        rows = result.values()
+
+    return (
+        np.array([r[0] for r in rows], dtype=np.int64),
+        [r[1] for r in rows],
+        np.array([r[2] for r in rows], dtype=np.int64),
+        np.array([r[3] for r in rows], dtype=np.int64),
+    )
+
+
+def fetch_edges(driver, edge_types=EDGE_TYPES):
+    """
+    Returns the source and target internal node ids of the edges between two papers,
+    by edge type. Integer ids are much cheaper to transfer than paper_id strings, so
+    each type is fetched with its own query instead of returning type(r).
+    """
+    edges = {}
+    with driver.session() as session:
+        for edge_type in edge_types:
+            with metrics.neo4j_query(f"snapshot_edges_{edge_type.lower()}"):
+                result = session.run(
+                    f"""
+                    MATCH (p1:Paper)-[:{edge_type}]->(p2:Paper)
+                    RETURN id(p1) AS source, id(p2) AS target
+                """
+                )
+                pairs = np.array(result.values(), dtype=np.int64).reshape(-1, 2)
+            edges[edge_type] = (pairs[:, 0], pairs[:, 1])
+    return edges
+
+
+def build_edge_index(node_ids, sources, targets):
+    """
+    Maps edge endpoints from node ids to positions in `node_ids` with a sorted search,
+    dropping edges with an endpoint outside the node set and duplicate edges.
+    """
+    order = np.argsort(node_ids)
+    sorted_ids = node_ids[order]
+
+    def positions(ids):
+        pos = np.clip(np.searchsorted(sorted_ids, ids), 0, max(len(sorted_ids) - 1, 0))
+        found = sorted_ids[pos] == ids if len(sorted_ids) else np.zeros(len(ids), bool)
+        return order[pos], found
+
+    src, src_found = positions(sources)
+    dst, dst_found = positions(targets)
+    keep = src_found & dst_found
+    keys = np.unique(src[keep] * len(node_ids) + dst[keep])
+    return torch.from_numpy(np.stack([keys // len(node_ids), keys % len(node_ids)]))
+
+
+def select_edges(snapshot, edge_types):
+    """
+    edge_index of the snapshot restricted to `edge_types`, without duplicate edges.
+    """
+    missing = set(edge_types) - set(snapshot["edge_index_by_type"])
+    if missing:
+        raise ValueError(f"Snapshot has no edges of type {sorted(missing)}")
+    edges = torch.cat([snapshot["edge_index_by_type"][t] for t in edge_types], dim=1)
+    return torch.unique(edges, dim=1)
+
+
+def build_snapshot(driver, store, edge_types=EDGE_TYPES):
+    start = time.perf_counter()
+    node_ids, ids, years, citations = fetch_papers(driver)
+
+    # Papers embedded after the store was last updated are left out
+    rows = store.rows(ids)
+    keep = rows >= 0
+    node_ids, years, citations = node_ids[keep], years[keep], citations[keep]
+    rows = rows[keep]
+    ids = [paper_id for paper_id, k in zip(ids, keep) if k]
+
+    # Concatenate features (read from the memory-mapped store) with year
+    x = np.empty((len(ids), store.vectors.shape[1] + 1), dtype=np.float32)
+    x[:, :-1] = store.vectors[rows]
+    x[:, -1] = years
+    mean = x.mean(axis=0)
+    std = x.std(axis=0, ddof=1)
+    std[std == 0] = 1.0
+
+    edge_index_by_type = {
+        edge_type: build_edge_index(node_ids, sources, targets)
+        for edge_type, (sources, targets) in fetch_edges(driver, edge_types).items()
+    }
+    snapshot = {
+        "ids": ids,
+        "x": torch.from_numpy((x - mean) / std),
+        # Target variable (citations), log-transformed to reduce skewness
+        "y": torch.log1p(torch.from_numpy(citations).float()),
+        "year": torch.from_numpy(years),
+        "citations": torch.from_numpy(citations),
+        "edge_index_by_type": edge_index_by_type,
+        "mean": torch.from_numpy(mean),
+        "std": torch.from_numpy(std),
+        "edge_types": list(edge_types),
+        "model_name": store.model_name,
+    }
+    snapshot["edge_index"] = select_edges(snapshot, edge_types)
+    print(
+        f"Built snapshot: {len(ids)} nodes, {snapshot['edge_index'].shape[1]} edges "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return snapshot
+
+
+def load_snapshot(driver, store, edge_types=EDGE_TYPES, rebuild=False):
+    """
+    Returns the snapshot of the current graph version, building and saving it first
+    if it does not exist yet.
+    """
+    version = graph_version(driver, store, edge_types)
+    path = os.path.join(SNAPSHOT_DIR, f"graph_{version}.pt")
+    if os.path.exists(path) and not rebuild:
+        print(f"Loading snapshot {path}")
+        return torch.load(path)
+
+    snapshot = build_snapshot(driver, store, edge_types)
+    snapshot["version"] = version
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    torch.save(snapshot, path)
+    print(f"Saved snapshot to {path}")
+    return snapshot
@@ -0,0 +1,215 @@
+import numpy as np
+from functools import lru_cache
+
+
+"""
+Synthetic OpenAlex-shaped corpus for benchmarks, from 10k to 10M works:
+
+1. 🎲 Every block of works is generated from its own seeded RNG, so any work can be
+   rebuilt on demand and no corpus is ever held in memory
+2. 📈 Publication counts grow by year, citations are lognormal and grow with age,
+   author productivity and topic popularity are heavy-tailed and topics rise and fade
+3. 🧾 Works are served as OpenAlex JSON (abstract_inverted_index, authorships, topics,
+   related_works, cited_by_api_url), or as NumPy arrays for the embedding and GNN stages
+"""
+
+# ---------- CONFIG ---------- #
+BLOCK_SIZE = 1024  # works generated together from one RNG
+NUM_TOPICS = 4516  # topics in OpenAlex
+VOCABULARY_SIZE = 30_000
+AUTHORS_PER_WORK = 0.6  # distinct authors per work in the corpus
+MIN_YEAR = 2008
+MAX_YEAR = 2024
+YEARLY_GROWTH = 1.12  # more works are published each year
+RELATED_WORKS = 10
+MAX_CITING = 25  # works listed by the cited_by endpoint (OpenAlex default page size)
+EMBEDDING_DIM = 384
+# ---------------------------- #
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vi", "zo", "pe", "shu", "dra", "len"]
+
+
+def pseudo_word(k):
+    """Deterministic pronounceable word for vocabulary index `k`."""
+    word = ""
+    while True:
+        k, r = divmod(k, len(SYLLABLES))
+        word += SYLLABLES[r]
+        if k == 0:
+            return word
+        k -= 1
+
+
+class SyntheticOpenAlex:
+    def __init__(self, num_works, seed=0, base_url="https://api.openalex.org"):
+        self.num_works = num_works
+        self.seed = seed
+        self.base_url = base_url
+        self.num_authors = max(1, int(num_works * AUTHORS_PER_WORK))
+
+        rng = np.random.default_rng([seed, 1])
+        self.vocabulary = [pseudo_word(k) for k in range(VOCABULARY_SIZE)]
+        self.topic_names = [
+            f"{pseudo_word(3 * t).title()} {pseudo_word(3 * t + 1)} {pseudo_word(t)}"
+            for t in range(NUM_TOPICS)
+        ]
+        self.topic_centers = rng.standard_normal((NUM_TOPICS, EMBEDDING_DIM)).astype(
+            np.float32
+        )
+        years = np.arange(MIN_YEAR, MAX_YEAR + 1)
+        weights = YEARLY_GROWTH ** (years - MIN_YEAR)
+        self.years, self.year_p = years, weights / weights.sum()
+
+    @lru_cache(maxsize=64)
+    def block(self, b):
+        """
+        Numeric columns of the works of block `b`, generated with vectorized draws.
+        """
+        start, stop = b * BLOCK_SIZE, min((b + 1) * BLOCK_SIZE, self.num_works)
+        n = stop - start
+        rng = np.random.default_rng([self.seed, 0, b])
+
+        year = rng.choice(self.years, size=n, p=self.year_p)
+        age = (MAX_YEAR + 1 - year).astype(np.float64)
+        citations = np.floor(rng.lognormal(1.0, 1.4, n) * np.sqrt(age)).astype(np.int64)
+
+        # Topic popularity follows a power law whose head drifts with the year, so
+        # some topics emerge and others fade
+        popularity = np.floor(NUM_TOPICS * rng.random((n, 3)) ** 2.5).astype(np.int64)
+        topics = (popularity + (year[:, None] - MIN_YEAR) * 37) % NUM_TOPICS
+        num_topics = 1 + rng.binomial(2, 0.5, n)
+
+        # Heavy-tailed productivity: low author ids write most of the papers
+        num_authors = 1 + rng.poisson(3.0, n)
+        authors = np.floor(
+            self.num_authors * rng.random(num_authors.sum()) ** 3
+        ).astype(np.int64)
+
+        # Related works are mostly close in id (similar crawl neighbourhood)
+        ids = np.arange(start, stop)
+        offsets = np.rint(rng.normal(0, 5000, (n, RELATED_WORKS))).astype(np.int64)
+        related = (ids[:, None] + np.where(offsets == 0, 1, offsets)) % self.num_works
+
+        # Citing works come after the cited one
+        num_citing = np.minimum(citations, MAX_CITING)
+        citing = (
+            ids.repeat(num_citing) + 1 + rng.geometric(1e-3, num_citing.sum())
+        ) % self.num_works
+
+        return {
+            "start": start,
+            "year": year,
+            "citations": citations,
+            "topics": topics,
+            "num_topics": num_topics,
+            # Ragged columns are flat, with the offset of each work's first entry
+            "authors": authors,
+            "author_offsets": np.concatenate([[0], np.cumsum(num_authors)]),
+            "related": related,
+            "citing": citing,
+            "citing_offsets": np.concatenate([[0], np.cumsum(num_citing)]),
+        }
+
+    @lru_cache(maxsize=64)
+    def words(self, b):
+        """
+        Vocabulary indices of the title (first 8) and abstract of each work of block
+        `b`. Kept apart from the numeric columns, which are much cheaper to draw.
+        """
+        n = min((b + 1) * BLOCK_SIZE, self.num_works) - b * BLOCK_SIZE
+        rng = np.random.default_rng([self.seed, 3, b])
+        abstract_length = np.clip(rng.normal(170, 50, n), 40, 400).astype(np.int64)
+        words = np.minimum(
+            rng.zipf(1.3, abstract_length.sum() + 8 * n) - 1, VOCABULARY_SIZE - 1
+        )
+        return np.split(words, np.cumsum(abstract_length + 8)[:-1])
+
+    def work_id(self, i):
+        return f"https://openalex.org/W{i}"
+
+    def work(self, i):
+        """Work `i` as returned by the OpenAlex /works endpoints."""
+        block = self.block(i // BLOCK_SIZE)
+        j = i - block["start"]
+        words = self.words(i // BLOCK_SIZE)[j]
+        title, abstract = words[:8], words[8:]
+
+        inverted_index = {}
+        for position, w in enumerate(abstract.tolist()):
+            inverted_index.setdefault(self.vocabulary[w], []).append(position)
+
+        return {
+            "id": self.work_id(i),
+            "doi": f"https://doi.org/10.5555/synthetic.{i}",
+            "title": " ".join(self.vocabulary[w] for w in title).capitalize(),
+            "publication_year": int(block["year"][j]),
+            "cited_by_count": int(block["citations"][j]),
+            "abstract_inverted_index": inverted_index,
+            "topics": [
+                {
+                    "id": f"https://openalex.org/T{t}",
+                    "display_name": self.topic_names[t],
+                }
+                for t in block["topics"][j][: block["num_topics"][j]].tolist()
+            ],
+            "authorships": [
+                {
+                    "author": {
+                        "id": f"https://openalex.org/A{a}",
+                        "display_name": f"{pseudo_word(a).title()} {pseudo_word(a // 7).title()}",
+                    }
+                }
+                for a in block["authors"][
+                    block["author_offsets"][j] : block["author_offsets"][j + 1]
+                ].tolist()
+            ],
+            "related_works": [self.work_id(r) for r in block["related"][j].tolist()],
+            "cited_by_api_url": f"{self.base_url}/works?filter=cites:W{i}",
+        }
+
+    def works(self, start=0, stop=None):
+        for i in range(start, min(stop or self.num_works, self.num_works)):
+            yield self.work(i)
+
+    def citing(self, i):
+        """Works listed by the cited_by_api_url of work `i`."""
+        block = self.block(i // BLOCK_SIZE)
+        j = i - block["start"]
+        offsets = block["citing_offsets"]
+        return [
+            self.work(c) for c in block["citing"][offsets[j] : offsets[j + 1]].tolist()
+        ]
+
+    def _columns(self, n, *keys):
+        """Per-work columns `keys` of the first `n` works, reading each block once."""
+        blocks = [self.block(b) for b in range((n + BLOCK_SIZE - 1) // BLOCK_SIZE)]
+        return [np.concatenate([block[key] for block in blocks])[:n] for key in keys]
+
+    def embeddings(self, n, noise=0.8):
+        """
+        Normalized float32 embeddings of the first `n` works, scattered around the
+        center of their primary topic.
+        """
+        rng = np.random.default_rng([self.seed, 2])
+        (topics,) = self._columns(n, "topics")
+        topics = topics[:, 0]
+        x = self.topic_centers[topics]
+        x += noise * rng.standard_normal(x.shape, dtype=np.float32)
+        x /= np.linalg.norm(x, axis=1, keepdims=True)
+        return x
+
+    def graph(self, n):
+        """
+        Features ([embedding, year]), log citations and a related-work edge_index
+        (as NumPy arrays) of the subgraph of the first `n` works.
+        """
+        year, citations, related = self._columns(n, "year", "citations", "related")
+        x = np.empty((n, EMBEDDING_DIM + 1), dtype=np.float32)
+        x[:, :-1] = self.embeddings(n)
+        x[:, -1] = (year - year.mean()) / max(year.std(), 1.0)
+        y = np.log1p(citations).astype(np.float32)
+
+        sources = np.arange(n).repeat(RELATED_WORKS)
+        targets = related.ravel()
+        keep = targets < n
+        return x, y, np.stack([sources[keep], targets[keep]])
@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+"""
+Vectorized trend detection over the number of papers per topic and year:
+
+1. 🧮 Pivot the (topic, year, papers_published) rows into a dense topic×year count matrix
+2. 📈 Score every topic at once: CAGR, least-squares slope, acceleration and z-scored bursts
+3. ➕ Append a new year of counts in place, without rebuilding the matrix
+
+The ranking is written to output/topic_trends.csv, which visualization/emerging_topics.py plots.
+"""
+
+# ---------- CONFIG ---------- #
+START_YEAR = 2010
+END_YEAR = 2022  # 2023-2025 have incomplete data
+SLOPE_WINDOW = 5  # most recent years used for the slope and acceleration
+CAGR_WINDOW = None  # years used for the CAGR, None uses START_YEAR..END_YEAR
+BURST_WINDOW = 5  # years before the last one that a burst is measured against
+BURST_Z = 2.0  # z-score from which the last year counts as a burst
+RANK_BY = "slope"
+# ---------------------------- #
+
+
+class TopicYearMatrix:
+    """
+    Dense topic×year matrix of paper counts over consecutive years. Years without
+    papers of a topic are zeros, so every topic can be compared over the same years.
+    """
+
+    def __init__(self, topics, years, counts):
+        self.topics = list(topics)
+        self.row_of = {topic: i for i, topic in enumerate(self.topics)}
+        self.years = np.asarray(years, dtype=np.int64)
+        # Over-allocated buffer, so add_year only copies when the capacity runs out
+        self._buffer = np.asarray(counts, dtype=np.float64)
+
+    @property
+    def counts(self):
+        return self._buffer[: len(self.topics), : len(self.years)]
+
+    @classmethod
+    def from_frame(cls, df, start_year=None, end_year=None):
+        """
+        Builds the matrix from a frame with topic, year and papers_published columns.
+        """
+        df = df[df["year"].between(start_year or -np.inf, end_year or np.inf)]
+        topics, topic_rows = np.unique(df["topic"].to_numpy(), return_inverse=True)
+        first_year = start_year or int(df["year"].min())
+        last_year = end_year or int(df["year"].max())
+        years = np.arange(first_year, last_year + 1)
+
+        counts = np.zeros((len(topics), len(years)))
+        np.add.at(
+            counts,
+            (topic_rows, df["year"].to_numpy() - first_year),
+            df["papers_published"].to_numpy(),
+        )
+        return cls(topics, years, counts)
+
+    @classmethod
+    def from_csv(cls, path, start_year=START_YEAR, end_year=END_YEAR):
+        return cls.from_frame(pd.read_csv(path), start_year, end_year)
+
+    def add_year(self, year, papers_by_topic):
+        """
+        Appends the counts of `year` (a {topic: papers} mapping). Years skipped since
+        the last one are filled with zeros and unseen topics get a zero history.
+        """
+        if year <= self.years[-1]:
+            raise ValueError(f"Year {year} is not after {self.years[-1]}")
+        new_years = np.arange(self.years[-1] + 1, year + 1)
+        new_topics = [t for t in papers_by_topic if t not in self.row_of]
+
+        rows = len(self.topics) + len(new_topics)
+        columns = len(self.years) + len(new_years)
+        if rows > self._buffer.shape[0] or columns > self._buffer.shape[1]:
+            buffer = np.zeros(
+                (
+                    max(rows, 2 * self._buffer.shape[0]),
+                    max(columns, 2 * self._buffer.shape[1]),
+                )
+            )
+            buffer[: len(self.topics), : len(self.years)] = self.counts
+            self._buffer = buffer
+        else:
+            self._buffer[:rows, len(self.years) : columns] = 0
+            self._buffer[len(self.topics) : rows, :columns] = 0
+
+        for topic in new_topics:
+            self.row_of[topic] = len(self.topics)
+            self.topics.append(topic)
+        self.years = np.concatenate([self.years, new_years])
+
+        topic_rows = np.fromiter(
+            (self.row_of[t] for t in papers_by_topic), np.int64, len(papers_by_topic)
+        )
+        self._buffer[topic_rows, columns - 1] = np.fromiter(
+            papers_by_topic.values(), np.float64, len(papers_by_topic)
+        )
+
+    def window(self, years):
+        """Counts and years of the last `years` years (all years for None)."""
+        start = 0 if years is None else max(0, len(self.years) - years)
+        return self.counts[:, start:], self.years[start:]
+
+
+def least_squares(counts, years, degree):
+    """
+    Polynomial fit of every row of `counts` against `years` in one lstsq call.
+    Returns the coefficients, highest degree first, with shape (degree + 1, topics).
+    """
+    x = years - years.mean()
+    design = np.vander(x, degree + 1)
+    coefficients, *_ = np.linalg.lstsq(design, counts.T, rcond=None)
+    return coefficients
+
+
+def trend_metrics(
+    matrix,
+    slope_window=SLOPE_WINDOW,
+    cagr_window=CAGR_WINDOW,
+    burst_window=BURST_WINDOW,
+    burst_z=BURST_Z,
+    rank_by=RANK_BY,
+):
+    """
+    Growth metrics of every topic, ranked by `rank_by` (1 = fastest growing):
+
+    - cagr: compound annual growth rate of the papers per year over `cagr_window`,
+      with one paper added to both ends so topics absent in the first year are defined
+    - slope: papers per year gained, from a linear fit over `slope_window`
+    - acceleration: change of that slope per year, from a quadratic fit over `slope_window`
+    - burst_z: z-score of the last year against the `burst_window` years before it
+    """
+    counts, years = matrix.window(cagr_window)
+    span = max(years[-1] - years[0], 1)
+    cagr = ((counts[:, -1] + 1) / (counts[:, 0] + 1)) ** (1 / span) - 1
+
+    counts, years = matrix.window(slope_window)
+    slope = least_squares(counts, years, 1)[0]
+    acceleration = np.full(len(matrix.topics), np.nan)
+    if len(years) >= 3:
+        acceleration = 2 * least_squares(counts, years, 2)[0]
+
+    counts, _ = matrix.window(burst_window + 1)
+    baseline = counts[:, :-1]
+    z = (counts[:, -1] - baseline.mean(axis=1)) / np.maximum(baseline.std(axis=1), 1.0)
+
+    trends = pd.DataFrame(
+        {
+            "topic": matrix.topics,
+            "papers_last_year": matrix.counts[:, -1].astype(np.int64),
+            "cagr": cagr,
+            "slope": slope,
+            "acceleration": acceleration,
+            "burst_z": z,
+            "burst": z >= burst_z,
+        }
+    )
+    trends = trends.sort_values(rank_by, ascending=False, ignore_index=True)
+    trends.insert(0, "rank", np.arange(1, len(trends) + 1))
+    return trends
+
+
+def main(input_csv="output/emerging_topics.csv", output_csv="output/topic_trends.csv"):
+    matrix = TopicYearMatrix.from_csv(input_csv)
+    start = time.perf_counter()
+    trends = trend_metrics(matrix)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Ranked {len(matrix.topics)} topics over {matrix.years[0]}-{matrix.years[-1]} "
+        f"in {elapsed * 1000:.1f} ms, {int(trends['burst'].sum())} bursting"
+    )
+    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+    trends.to_csv(output_csv, index=False, float_format="%.4f")
+    print(f"Exported topic trends to {output_csv}")
+
+
+if __name__ == "__main__":
+    # Optionally pass the input and output CSV paths
+    main(*sys.argv[1:3])
@@ -3,19 +3,27 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 
 import os
+import sys
 from pathlib import Path
 
-output_dir = Path(os.path.dirname(__file__)).parent / "output"
+root_dir = Path(os.path.dirname(__file__)).parent
+output_dir = root_dir / "output"
 
-# Load the CSV file
+sys.path.insert(0, str(root_dir))
+from src.trends import START_YEAR, END_YEAR, SLOPE_WINDOW
+
+slope_start = max(START_YEAR, END_YEAR - SLOPE_WINDOW + 1)
+
+# Load the CSV files (topic_trends.csv is written by `python -m src.trends`)
 df = pd.read_csv(f"{output_dir}/emerging_topics.csv")
+trends = pd.read_csv(f"{output_dir}/topic_trends.csv")
 
 # Ensure correct data types
 df["year"] = df["year"].astype(int)
 df["papers_published"] = df["papers_published"].astype(int)
 
-# Only plot since 2010 until 2022 (2023-2025 incomplete data)
-df = df[df["year"].between(2010, 2022)]
+# Only plot the years the trends were computed over (2023-2025 incomplete data)
+df = df[df["year"].between(START_YEAR, END_YEAR)]
 
 # Get the top 10 topics per year
 top_topics_per_year = (
@@ -30,16 +38,21 @@ top_topics_overall = top_topics_per_year["topic"].unique()
 # Filter the main dataframe to include only these topics
 df_top = df[df["topic"].isin(top_topics_overall)]
 
-# Pivot to get a dataframe with years as index and topics as columns
+# Pivot to get a dataframe with years as index and topics as columns, with a row
+# for every year even if none of these topics has papers in it
 pivot_df = df_top.pivot_table(
     index="year", columns="topic", values="papers_published", fill_value=0
+).reindex(range(START_YEAR, END_YEAR + 1), fill_value=0)
+
+# Rank the plotted topics by their least-squares slope (papers/year gained) over the
+# last SLOPE_WINDOW years, whatever trends.py ranked its CSV by
+increase = (
+    trends[trends["topic"].isin(pivot_df.columns)]
+    .set_index("topic")["slope"]
+    .sort_values(ascending=False)
 )
 
-# Get increase between 2010 and 2022
-increase = pivot_df.loc[2022] - pivot_df.loc[2010]
-increase = increase.sort_values(ascending=False)
-
-# Top 5 and bottom 5 topics by increase
+# Top 5 and bottom 5 topics by trend
 top5_increase = increase.head(5).index
 bottom5_increase = increase.tail(5).index
 
@@ -86,9 +99,20 @@ sorted_handles_labels = sorted(
 
 handles, labels = zip(*sorted_handles_labels)
 
-ax.set_title("Top 10 Topics per Year — Growth (2010-2022)", fontsize=16)
+ax.set_title(
+    f"Top 10 Topics per Year ({START_YEAR}-{END_YEAR}) — "
+    f"Ranked by Slope ({slope_start}-{END_YEAR})",
+    fontsize=16,
+)
 ax.set_xlabel("Year")
 ax.set_ylabel("Number of Papers Published")
-ax.legend(handles, labels, title="Topic", bbox_to_anchor=(1.05, 1), loc="upper left")
+ax.axvspan(slope_start, END_YEAR, color="grey", alpha=0.1)
+ax.legend(
+    handles,
+    labels,
+    title=f"Topic (rank by papers/year slope, {slope_start}-{END_YEAR})",
+    bbox_to_anchor=(1.05, 1),
+    loc="upper left",
+)
 plt.tight_layout()
 plt.savefig(f"{output_dir}/emerging_topics_growth.png", dpi=300)